@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: post = KPosterior()
+       post.update(r1, d1, r2, d2, choice)   # after every staircase trial
+       k, m = post.estimate()
+
+Online Bayesian estimate of the hyperbolic-softmax parameters of FitK
+(V=r/(1+kd), p(choose r2,d2) = 1/(1+exp(-m*(V2-V1)))). The posterior is
+kept on a log-spaced (k, m) grid with a flat prior in log k and, by default,
+a weak normal prior on log10(m) (offers near indifference say little about 
+m, and without it k stays uncertain for a long time). Every choice updates
+the posterior with one vectorized pass over the grid, which takes well under
+a millisecond. width() is the posterior sd of log10(k), which can
+be used to stop a staircase once k is known precisely enough.
+
+bestoffer picks, from a candidate set of offers (see offergrid), the one with
+the largest expected information gain about (k, m) under the current 
+posterior (adaptive design optimization). Candidates are scored in 
+vectorized chunks against a few hundred cells resampled from the posterior,
+and scoring stops before the time budget is exceeded. simposterior runs the
+posterior staircase of stairK.py for a simulated chooser.
+
+@author: christianrodriguez
+"""
+
+class KPosterior(object):
+    '''
+    Posterior over a grid of k (rows) and m (columns) values. mprior is the
+    (mean, sd) of the normal prior on log10(m), None for a flat prior.
+    '''
+
+    def __init__(self, ks=None, ms=None, mprior=(0, .5)):
+
+        import numpy
+
+        if ks is None:
+            ks = numpy.logspace(-4, 0, 81)
+        if ms is None:
+            ms = numpy.logspace(-2, numpy.log10(200), 61)
+        self.ks = numpy.asarray(ks, dtype=float)
+        self.ms = numpy.asarray(ms, dtype=float)
+        self.kk, self.mm = numpy.meshgrid(self.ks, self.ms, indexing='ij')
+        self.logk = numpy.log10(self.kk)
+        self.logm = numpy.log10(self.mm)
+        self.logpost = numpy.zeros(self.kk.shape)
+        if mprior is not None:
+            self.logpost -= .5*((self.logm - mprior[0])/mprior[1])**2
+        self.ntrials = 0
+
+    def loglik(self, r1, d1, r2, d2, choice):
+        '''
+        log p(choice) at every grid point for one trial.
+        '''
+
+        import numpy
+
+        x = self.mm*(r2/(1 + self.kk*d2) - r1/(1 + self.kk*d1))
+        return choice*x - numpy.logaddexp(0, x)
+
+    def update(self, r1, d1, r2, d2, choice):
+        '''
+        Adds one choice (1 for (r2,d2), 0 for (r1,d1)) to the posterior.
+        '''
+
+        self.logpost += self.loglik(r1, d1, r2, d2, choice)
+        self.logpost -= self.logpost.max()
+        self.ntrials = self.ntrials + 1
+
+    def post(self):
+        '''
+        Normalized posterior probabilities on the grid.
+        '''
+
+        import numpy
+
+        p = numpy.exp(self.logpost)
+        return p / p.sum()
+
+    def estimate(self):
+        '''
+        Posterior mean of (log k, log m), returned as (k, m).
+        '''
+
+        import numpy
+
+        p = self.post()
+        return 10**numpy.sum(p*self.logk), 10**numpy.sum(p*self.logm)
+
+    def width(self):
+        '''
+        Posterior sd of log10(k).
+        '''
+
+        import numpy
+
+        p = self.post()
+        mean = numpy.sum(p*self.logk)
+        return numpy.sqrt(numpy.sum(p*(self.logk - mean)**2))
+
+    def done(self, target=.1, mintrials=10):
+        '''
+        True once at least mintrials choices were seen and width() is at or
+        below target.
+        '''
+
+        return self.ntrials >= mintrials and self.width() <= target
+
+    def bestoffer(self, offers, budget=.1, ncells=300, chunk=512):
+        '''
+        Index of the offer (a row [r1 d1 r2 d2] of offers) with the largest
+        expected information gain, and the gains of all offers (nan for any
+        not scored). The posterior is approximated by ncells grid cells 
+        drawn by systematic resampling. Offers are scored chunk at a time, in
+        random order, until the next chunk would exceed budget seconds (at 
+        least one chunk is always scored).
+        '''
+
+        import numpy, time
+
+        start = time.time()
+        offers = numpy.asarray(offers, dtype=float)
+
+        # a few hundred cells that represent the posterior
+        p = self.post().ravel()
+        pick = numpy.searchsorted(numpy.cumsum(p), 
+                                  (numpy.arange(ncells) + .5) / ncells)
+        cells, counts = numpy.unique(numpy.minimum(pick, len(p) - 1), 
+                                     return_counts=True)
+        w = counts / float(ncells)
+        kk = self.kk.ravel()[cells]
+        mm = self.mm.ravel()[cells]
+
+        gains = numpy.full(len(offers), numpy.nan)
+        order = numpy.random.permutation(len(offers))
+        for i in range(0, len(offers), chunk):
+            rows = order[i:i+chunk]
+            r1, d1, r2, d2 = [c[:,None] for c in offers[rows].T]
+            x = mm*(r2/(1 + kk*d2) - r1/(1 + kk*d1))
+
+            # entropy of the predicted choice minus the expected entropy
+            # of the choice given (k, m)
+            pll = .5 + .5*numpy.tanh(.5*x)
+            hcond = numpy.logaddexp(0, x) - pll*x
+            pbar = numpy.clip(numpy.dot(pll, w), 1e-12, 1 - 1e-12)
+            hmarg = -pbar*numpy.log(pbar) - (1 - pbar)*numpy.log(1 - pbar)
+            gains[rows] = hmarg - numpy.dot(hcond, w)
+
+            # stop if another chunk would not fit in the budget
+            spent = time.time() - start
+            if spent * (i + 2*chunk) / float(i + chunk) > budget:
+                break
+
+        return numpy.nanargmax(gains), gains
+
+def offergrid(ssopts=((10, 0), (10, 15), (20, 0), (20, 15)), 
+              lldels=range(16, 46), ratios=None, kmax=1, nratios=80):
+    '''
+    Candidate offers [r1 d1 r2 d2] combining every smaller sooner option in
+    ssopts with every larger later delay in lldels and larger later amounts
+    of ratio times the smaller amount (rounded to 10 cents). By default the
+    nratios ratios are log-spaced from 1.05 to 1 + kmax*max(lldels), the
+    ratio at indifference for k = kmax (the top of the posterior grid), so
+    every k on the grid has offers near its indifference points.
+    '''
+
+    import numpy
+
+    if ratios is None:
+        ratios = numpy.logspace(numpy.log10(1.05), 
+                                numpy.log10(1 + kmax*max(lldels)), nratios)
+    ss = numpy.asarray(ssopts, dtype=float)
+    i, j, l = numpy.meshgrid(numpy.arange(len(ss)), numpy.asarray(lldels), 
+                             ratios, indexing='ij')
+    i, j, l = i.ravel(), j.ravel(), l.ravel()
+    return numpy.column_stack((ss[i,0], ss[i,1], numpy.round(ss[i,0]*l, 1), j))
+
+def simposterior(k, m, ntrials=60, target=.1, mintrials=10, adaptive=True,
+                 budget=float('inf'), rng=None, **gridopts):
+    '''
+    Runs the posterior staircase of stairK.py (useposterior=True) for one
+    softmax-hyperbolic chooser with parameters k and m, picking offers from
+    offergrid(**gridopts) by expected information gain if adaptive, and
+    stopping like stairK.py. Offers are scored within budget seconds (all of
+    them by default). Returns the trials as an array [ssamnt ssdel llamnt
+    lldel choice] and the posterior.
+    '''
+
+    import numpy
+
+    if rng is None:
+        rng = numpy.random
+    post = KPosterior()
+    gridopts.setdefault('kmax', post.ks.max())
+    candidates = offergrid(**gridopts)
+    ssopts = ((10, 0), (10, 15), (20, 0), (20, 15))
+    kval = .02
+    trials = []
+    for trial in range(ntrials):
+
+        # the next offer, like itc_stair
+        if adaptive:
+            r1, d1, r2, d2 = candidates[post.bestoffer(candidates, budget)[0]]
+        else:
+            r1, d1 = ssopts[rng.randint(0, len(ssopts))]
+            d2 = rng.randint(16, 46)
+            ssval = r1/(1. + kval*d1)
+            r2 = round(ssval + ssval*kval*d2, 1)
+
+        # softmax choice of the chooser
+        x = m*(r2/(1. + k*d2) - r1/(1. + k*d1))
+        choice = float(rng.rand() < .5 + .5*numpy.tanh(.5*x))
+        trials.append([r1, d1, r2, d2, choice])
+        post.update(r1, d1, r2, d2, choice)
+        kval = post.estimate()[0]
+        if post.done(target, mintrials):
+            break
+
+    return numpy.array(trials), post
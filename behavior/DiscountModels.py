@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: res = fitmodel('exponential', data, subj)
+   or: table = comparemodels(data, subj)
+
+Registry of discount models that share the softmax choice rule of FitK,
+  p(choose r2,d2) = 1/(1+exp(-m*(V(r2,d2)-V(r1,d1))))
+and one fitting engine. Every model declares its value function V, the
+gradient of V with respect to its parameters, parameter bounds and a few
+starting values. data and subj are the stacked trials and subject of every
+row, like in GroupFitK. All subjects (and all models in comparemodels) are
+fitted with FitK.batchmin, using per-subject segment sums and Fisher scoring
+for the curvature.
+
+Registered models (MODELS):
+  hyperbolic    V = r/(1+k*d)
+  exponential   V = r*exp(-k*d)
+  betadelta     V = r if d == 0, else r*beta*delta**d (quasi-hyperbolic)
+  hyperboloid   V = r/(1+k*d)**s (Myerson & Green)
+  additive      V = r - k*d**s (additive utility with linear utility of r)
+
+New models can be added with register.
+
+@author: christianrodriguez
+"""
+
+from FitK import FitResult, batchmin, choiceloss, trialcolumns
+from GroupFitK import Segments
+
+MODELS = {}
+
+def register(model):
+    '''
+    Adds a DiscountModel instance to MODELS under its name.
+    '''
+
+    MODELS[model.name] = model
+    return model
+
+class DiscountModel(object):
+    '''
+    Base class for discount models. Subclasses set name, params (names of
+    the value function parameters), bounds and starts (one tuple per start)
+    and implement value(theta, r, d) and grad(theta, r, d), where theta has
+    one row of parameters per trial. grad returns dV/dtheta with one column
+    per parameter.
+    '''
+
+    name   = None
+    params = ()
+    bounds = ()
+    starts = ()
+
+    def value(self, theta, r, d):
+        raise NotImplementedError
+
+    def grad(self, theta, r, d):
+        raise NotImplementedError
+
+class Hyperbolic(DiscountModel):
+
+    name   = 'hyperbolic'
+    params = ('k',)
+    bounds = ((0, 1),)
+    starts = ((.002,), (.02,), (.2,))
+
+    def value(self, theta, r, d):
+        return r/(1 + theta[:,0]*d)
+
+    def grad(self, theta, r, d):
+        return (-r*d/(1 + theta[:,0]*d)**2)[:,None]
+
+class Exponential(DiscountModel):
+
+    name   = 'exponential'
+    params = ('k',)
+    bounds = ((0, 1),)
+    starts = ((.001,), (.01,), (.1,))
+
+    def value(self, theta, r, d):
+        import numpy
+        return r*numpy.exp(-theta[:,0]*d)
+
+    def grad(self, theta, r, d):
+        import numpy
+        return (-r*d*numpy.exp(-theta[:,0]*d))[:,None]
+
+class BetaDelta(DiscountModel):
+
+    name   = 'betadelta'
+    params = ('beta', 'delta')
+    bounds = ((0, 1), (.5, 1))
+    starts = ((.5, .99), (.9, .99), (.9, .9))
+
+    def value(self, theta, r, d):
+        import numpy
+        beta, delta = theta[:,0], theta[:,1]
+        return numpy.where(d > 0, r*beta*delta**d, r)
+
+    def grad(self, theta, r, d):
+        import numpy
+        beta, delta = theta[:,0], theta[:,1]
+        later = d > 0
+        g = numpy.empty((len(theta), 2))
+        g[:,0] = numpy.where(later, r*delta**d, 0)
+        g[:,1] = numpy.where(later, r*beta*d*delta**(d - 1), 0)
+        return g
+
+class Hyperboloid(DiscountModel):
+
+    name   = 'hyperboloid'
+    params = ('k', 's')
+    bounds = ((0, 1), (0, 5))
+    starts = ((.02, 1), (.2, .5), (.002, 2))
+
+    def value(self, theta, r, d):
+        k, s = theta[:,0], theta[:,1]
+        return r/(1 + k*d)**s
+
+    def grad(self, theta, r, d):
+        import numpy
+        k, s = theta[:,0], theta[:,1]
+        D = 1 + k*d
+        V = r/D**s
+        g = numpy.empty((len(theta), 2))
+        g[:,0] = -s*d*V/D
+        g[:,1] = -V*numpy.log(D)
+        return g
+
+class Additive(DiscountModel):
+
+    name   = 'additive'
+    params = ('k', 's')
+    bounds = ((0, 10), (0, 2))
+    starts = ((.1, 1), (1, .5), (.01, 1.5))
+
+    def value(self, theta, r, d):
+        k, s = theta[:,0], theta[:,1]
+        return r - k*d**s
+
+    def grad(self, theta, r, d):
+        import numpy
+        k, s = theta[:,0], theta[:,1]
+        ds = d**s
+        g = numpy.empty((len(theta), 2))
+        g[:,0] = -ds
+        g[:,1] = -k*ds*numpy.log(numpy.where(d > 0, d, 1))
+        return g
+
+for _model in (Hyperbolic(), Exponential(), BetaDelta(), Hyperboloid(),
+               Additive()):
+    register(_model)
+
+class ModelFitter(object):
+    '''
+    Softmax fit of one discount model to the stacked trials of many
+    subjects. The last parameter of every row is the softmax slope m.
+    '''
+
+    mbounds = (0, 200)
+    mstarts = (.2, 2)
+
+    def __init__(self, model, data, subj):
+
+        if not isinstance(model, DiscountModel):
+            model = MODELS[model]
+        self.model = model
+        self.data, self.r1, self.d1, self.r2, self.d2, self.choice = \
+            trialcolumns(data)
+        self.segments = Segments(subj)
+        self.subjects = self.segments.subjects
+        self.idx = self.segments.idx
+        self.nsubj = self.segments.nsubj
+        self.ntrials = self.segments.ntrials
+        self.nparams = len(model.params) + 1
+        self.bounds = tuple(model.bounds) + (self.mbounds,)
+
+    def error(self, theta, order=0, rows=None):
+        '''
+        -1*loglikelihood of every subject (or of the subjects in rows) for
+        an (n, nparams) array of parameters. With order=2 the gradients and
+        Fisher information (used as Hessian) are also returned.
+        '''
+
+        import numpy
+
+        # make some shortcuts
+        bincount  = numpy.bincount
+
+        # pick the trials of the wanted subjects and number them 0..n-1
+        sel, pos = self.segments.select(rows)
+        r1, d1, r2, d2, y = [c[sel] for c in
+                             (self.r1, self.d1, self.r2, self.d2, self.choice)]
+        n = len(theta)
+        segsum = lambda w: bincount(pos, weights=w, minlength=n)
+
+        th = theta[pos]
+        vth = th[:,:-1]
+        m = th[:,-1]
+        net = self.model.value(vth, r2, d2) - self.model.value(vth, r1, d1)
+        x = m*net
+
+        # -log(p) of the observed choices, summed within subject (see
+        # FitK.choiceloss)
+        if not order:
+            return segsum(choiceloss(x, y))
+        loss, r, w = choiceloss(x, y, order)
+        nll = segsum(loss)
+
+        # derivatives of x = m*(V2-V1) for every trial
+        J = numpy.empty((len(x), self.nparams))
+        J[:,:-1] = m[:,None]*(self.model.grad(vth, r2, d2) -
+                               self.model.grad(vth, r1, d1))
+        J[:,-1] = net
+
+        p = self.nparams
+        g = numpy.empty((n, p))
+        H = numpy.empty((n, p, p))
+        for i in range(p):
+            g[:,i] = segsum(r*J[:,i])
+            for j in range(i + 1):
+                H[:,i,j] = H[:,j,i] = segsum(w*J[:,i]*J[:,j])
+
+        return nll, g, H
+
+    def fit(self, maxiter=10000):
+        '''
+        Fits every subject from all combinations of the model's starts and
+        mstarts, keeping the best per subject. Returns a FitResult with the
+        (n_subjects, nparams) estimates as theta, LL per subject and the
+        AIC and BIC of every subject.
+        '''
+
+        import numpy
+
+        lb, ub = zip(*self.bounds)
+        best = None
+        for vstart in self.model.starts:
+            for mstart in self.mstarts:
+                th0 = numpy.tile(tuple(vstart) + (mstart,), (self.nsubj, 1))
+                res = batchmin(self.error, th0, lb, ub, maxiter=maxiter,
+                               indexed=True)
+                if best is None:
+                    best = res
+                else:
+                    better = res.fun < best.fun
+                    for key in res:
+                        best[key][better] = res[key][better]
+
+        LL = -best.fun
+        p = self.nparams
+        return FitResult(model=self.model.name,
+                         params=self.model.params + ('m',),
+                         subjects=self.subjects, theta=best.xs, LL=LL,
+                         aic=2*p - 2*LL, bic=p*numpy.log(self.ntrials) - 2*LL,
+                         success=best.success, nfev=best.nfev)
+
+def fitmodel(model, data, subj, **opts):
+    '''
+    Fits a registered model (name or DiscountModel) to every subject, see
+    ModelFitter.fit.
+    '''
+
+    return ModelFitter(model, data, subj).fit(**opts)
+
+def comparemodels(data, subj, models=None, **opts):
+    '''
+    Fits several models (all registered ones by default) to every subject
+    and compares them. Returns a FitResult with per-model fits (fits), the
+    (n_subjects, n_models) LL, aic and bic tables, the model with the lowest
+    BIC for every subject (best) and the cohort-summed aic and bic.
+    '''
+
+    import numpy
+
+    if models is None:
+        models = sorted(MODELS)
+    fits = [fitmodel(mod, data, subj, **opts) for mod in models]
+    names = [f.model for f in fits]
+    LL  = numpy.column_stack([f.LL for f in fits])
+    aic = numpy.column_stack([f.aic for f in fits])
+    bic = numpy.column_stack([f.bic for f in fits])
+
+    return FitResult(models=names, subjects=fits[0].subjects,
+                     fits=dict(zip(names, fits)), LL=LL, aic=aic, bic=bic,
+                     best=numpy.array(names)[numpy.argmin(bic, 1)],
+                     totalaic=aic.sum(0), totalbic=bic.sum(0))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: cache = FitCache('/path/to/data/fitted/cache')
+       k, m, LL, res = cachedfitk(data, cache, init='grid')
+
+On-disk cache of fit results. Every entry is keyed by a hash of the trial
+matrix, the model name and the optimizer settings, so refitting a subject
+whose data did not change just reads the stored result back. Entries are
+small .npz files in one directory; when the directory grows beyond maxbytes
+the least recently used entries are removed.
+
+The random seed is not part of the key: it only changes which starting
+points are drawn, not the optimum that is found. Neither is a telemetry
+hook. VERSION is: bump it whenever a change to the fitting code changes
+the results or what an entry holds, so that older entries are never read
+back. Fits are stored and read through putfit and getfit only (by
+cachedfitk and FitK.fitcohort alike), so every entry has the same fields,
+including the likelihood surface of grid fits.
+
+@author: christianrodriguez
+"""
+
+# version of the cached fits, part of every key
+VERSION = 3
+
+class FitCache(object):
+    '''
+    Directory of cached fit results with size-based (least recently used)
+    eviction.
+    '''
+
+    def __init__(self, cachedir, maxbytes=50*2**20):
+
+        import os
+
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def key(self, data, model='hyperbolic', **settings):
+        '''
+        Hash of the trial matrix, model name, settings and VERSION.
+        '''
+
+        import hashlib, numpy
+
+        settings.pop('seed', None)
+        settings.pop('hook', None)
+        data = numpy.ascontiguousarray(data, dtype=float)
+        h = hashlib.sha1()
+        h.update(('v%d' % VERSION).encode())
+        h.update(repr(data.shape).encode())
+        h.update(data.tobytes())
+        h.update(model.encode())
+        h.update(repr(sorted(settings.items())).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return '%s/%s.npz' % (self.cachedir, key)
+
+    def get(self, key):
+        '''
+        Returns the stored dict of arrays for key, or None.
+        '''
+
+        import os, numpy
+
+        fname = self.path(key)
+        try:
+            with numpy.load(fname) as f:
+                entry = dict((name, f[name]) for name in f.files)
+        except (IOError, OSError, ValueError):
+            return None
+
+        # mark as recently used
+        os.utime(fname, None)
+        return entry
+
+    def put(self, key, **entry):
+        '''
+        Stores the named arrays of entry under key and evicts old entries if
+        the cache is too large.
+        '''
+
+        import numpy
+        from atomicwrite import atomicwrite
+
+        # readers never see half an entry
+        with atomicwrite(self.path(key)) as tmp:
+            numpy.savez(tmp, **entry)
+        self.evict(keep=key)
+
+    def getfit(self, key):
+        '''
+        The fit stored under key as a FitResult with x, fun, nstarts,
+        cached=True and, for grid fits, surface. None if not cached.
+        '''
+
+        from FitK import FitResult
+
+        hit = self.get(key)
+        if hit is None:
+            return None
+        res = FitResult(x=hit['x'], fun=float(hit['fun']),
+                        nstarts=int(hit['nstarts']), cached=True)
+        if 'ks' in hit:
+            res.surface = (hit['ks'], hit['ms'], hit['nll'])
+        return res
+
+    def putfit(self, key, res):
+        '''
+        Stores the x, fun, nstarts and (if any) surface of a KFitter.fit
+        result under key.
+        '''
+
+        entry = dict(x=res.x, fun=res.fun, nstarts=res.nstarts)
+        if 'surface' in res:
+            entry.update(zip(('ks', 'ms', 'nll'), res.surface))
+        self.put(key, **entry)
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used entries (other than keep) until the
+        cache fits in maxbytes.
+        '''
+
+        import os
+
+        entries = []
+        for name in os.listdir(self.cachedir):
+            if name.endswith('.npz') and not name.startswith('.'):
+                st = os.stat('%s/%s' % (self.cachedir, name))
+                entries.append((name == '%s.npz' % keep, st.st_mtime, 
+                                st.st_size, name))
+        total = sum(e[2] for e in entries)
+        for kept, _, size, name in sorted(entries):
+            if total <= self.maxbytes or kept:
+                break
+            try:
+                os.remove('%s/%s' % (self.cachedir, name))
+            except OSError:
+                pass
+            total = total - size
+
+def cachedfitk(data, cache, **opts):
+    '''
+    FitK.fitk with the result kept in cache. Returns (k, m, LL, res) where,
+    for a cached result, res only holds x, fun, nstarts and (for grid
+    starts) the likelihood surface.
+    '''
+
+    from FitK import KFitter
+
+    key = cache.key(data, **opts)
+    res = cache.getfit(key)
+    if res is not None and (opts.get('init') != 'grid' or 'surface' in res):
+        return res.x[0], res.x[1], -res.fun, res
+
+    k, m, LL, res = KFitter(data).fit(**opts)
+    cache.putfit(key, res)
+    res.cached = False
+    return k, m, LL, res
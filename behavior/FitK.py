@@ -3,18 +3,42 @@
 """
 Created on Tue Sep 16 14:19:34 2014
 
-Usage: [k, m, LL] = FitK(data)
+Usage: [k, m, LL, res] = fitk(data)
+   or: [k, m, LL, res] = KFitter(data).fit()
 
 Returns best fitting k for the discount function V=r/(1+kd).
 Input data must contain individual trials in rows with columns
   [r1 d1 r2 d2 choice]
 for choices betwen r1 at delay d1 and r2 at delay d2. choice must
 be 0 for choice of option (r1,d1) or 1 to indicate choice of (r2,d2).
+Trials without a response (nan) count as a choice of (r1,d1).
 Fitting is for maximum likelihood with a softmax function. m is the
 best fitting slope of the softmax function. Larger values of m
 indicate a better quality fit. LL is the log-likelihood of the best fit. 
 This is useful for statistical analysis of the significance of fitted 
-parameters (i.e. likelihood ratio test).
+parameters (i.e. likelihood ratio test). res summarizes the optimization.
+
+All random starting points (nstarts, 1000 by default, drawn log-uniformly
+over the k and m ranges of the likelihood grid) are optimized together with
+batched Newton steps inside the (1e-6,1)x(.001,200) bounds, see batchmin. m is
+kept off 0 because at m=0 every choice has p=.5 whatever k is, so a start
+that reached it could never move k again.
+With adaptive=True starts are run in batches of batchsize and fitting stops
+once the best -LL has been reproduced nrepeat times (within tol), or once
+patience starts went by without improving it. At least minstarts and at most 
+nstarts starts are used; res.nstarts reports how many were actually run.
+With init='grid' the -LL is first scored over a log-spaced (k, m) grid in one
+vectorized pass (gridsurface) and only the npolish best cells are optimized.
+The grid is returned as res.surface and can be drawn with plotsurface.
+fitcohort fits many subjects at once in a process pool and bootk gives 
+bootstrap confidence intervals for k and m.
+
+res.telemetry records the cost of a fit: the vectorized likelihood and
+derivative calls (ncalls, ngradcalls), the evaluations summed over starts
+(nfev, ngev), the wall time of the fit, of the grid scoring and the share of
+every start (time, gridtime, starttime), the number of starts that ended
+without a finite likelihood (nnonfinite) and the index of the winning start
+(best). A TelemetryLog aggregates it over a batch of fits.
 
 @author: christianrodriguez 
 Check out:
@@ -23,147 +47,725 @@ http://en.wikipedia.org/wiki/Hyperbolic_discounting
 
 """
 
-def fitk(data):
+class FitResult(dict):
+    '''
+    Summary of a fit. Entries can also be read as attributes, like the
+    OptimizeResult returned by scipy.optimize.minimize.
+    '''
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    __setattr__ = dict.__setitem__
+
+def trialcolumns(data):
+    '''
+    The trial matrix [r1 d1 r2 d2 choice] as a float array and its r1, d1,
+    r2, d2 and choice columns. Trials without a response (nan) count as ss
+    choices (choice 0), like the lls mask of the original errorfit.
+    '''
+    
+    import numpy
+    
+    data = numpy.array(data, dtype=float)
+    r1, d1, r2, d2, choice = [numpy.ascontiguousarray(c) for c in data[:,:5].T]
+    return data, r1, d1, r2, d2, (choice == 1).astype(float)
+
+def choiceloss(x, y, order=0):
+    '''
+    -log(p) of every choice y (1 for the second offer) under the softmax
+    p = 1/(1+exp(-x)), with log(1+exp(x)) computed stably so that saturated
+    choice probabilities never produce log(0). With order=2 the residual
+    p-y and the curvature p*(1-p) are also returned; the derivatives of the
+    -LL follow from them and the derivatives of x (see KFitter.error).
+    '''
     
-    from scipy import optimize
-    import numpy, math
+    import numpy
     
-    # make some shortcuts
-    nprand  = numpy.random.rand
+    loss = numpy.logaddexp(0, x) - y*x
+    if not order:
+        return loss
+    
+    # p of choosing the second offer
+    p = .5 + .5*numpy.tanh(.5*x)
+    return loss, p - y, p*(1 - p)
 
-    global d
-    d = data
-    LL = float('inf')
+class KFitter(object):
+    '''
+    Hyperbolic-softmax model for one trial matrix with columns 
+    [r1 d1 r2 d2 choice]. Amount, delay and choice columns are copied once 
+    when the fitter is built and nothing is stored globally, so separate 
+    fitters can be used at the same time (e.g. from different threads).
+    '''
     
-    # optimize parameters 100 times, using different starting points
-    randstarts = 0
-    while randstarts < 1000:
+    bounds = ((1e-6,1), (1e-3,200))
+    
+    # random starts are drawn log-uniformly over these k and m ranges
+    startranges = ((1e-4,1), (1e-2,200))
+    
+    def __init__(self, data):
+        
+        self.data, self.r1, self.d1, self.r2, self.d2, self.choice = \
+            trialcolumns(data)
+        
+        # boolean of ll and ss choices
+        self.lls = self.choice == 1
+        self.ss  = self.choice == 0
+
+    def errorfit(self, km):
+        '''
+        Computes -1*loglikelihood of softmax fit assuming hyperbolic 
+        discounting.
+        '''
+        
+        import numpy
+        
+        km = numpy.atleast_2d(numpy.asarray(km, dtype=float))
+        return self.error(km)[0]
+
+    def errorgrad(self, km):
+        '''
+        Gradient of errorfit with respect to (k, m), e.g. as jac for 
+        scipy.optimize.minimize.
+        '''
+        
+        import numpy
+        
+        km = numpy.atleast_2d(numpy.asarray(km, dtype=float))
+        return self.error(km, 2)[1][0]
+
+    def errorhess(self, km):
+        '''
+        Hessian of errorfit with respect to (k, m), e.g. as hess for 
+        scipy.optimize.minimize.
+        '''
+        
+        import numpy
         
-        # pick random initial values
-        km0 = [nprand() * .02, nprand() * 2]
+        km = numpy.atleast_2d(numpy.asarray(km, dtype=float))
+        return self.error(km, 2)[2][0]
+
+    def error(self, km, order=0):
+        '''
+        -1*loglikelihood of the softmax fit for every row of km, evaluated on
+        the whole (n_rows x n_trials) matrix at once. With order=2 the 
+        closed-form gradient and Hessian with respect to (k, m) are also 
+        returned.
+        '''
     
-        opts = {'maxiter':10000}
-        bnds = ((0,1), (0,200)) 
-        res = optimize.minimize(errorfit, km0, bounds=bnds, options=opts,\
-                                method='L-BFGS-B') #method='L-BFGS-B' TNC
+        import numpy
     
-        # evaluate the softmax at the given values                 
-        loglike = errorfit(res.x)
+        # make some shortcuts
+        npsum     = numpy.sum
 
-        # use the new values if the loglikelihood is decreased
-        if loglike < LL and not(math.isinf(loglike)):
-            km = res.x
-            LL = loglike
-            
-        randstarts = randstarts + 1
+        r1, d1, r2, d2, y = self.r1, self.d1, self.r2, self.d2, self.choice
+        k = km[:,:1]
+        m = km[:,1:]
+    
+        # discounted values based on current k guesses
+        D1 = 1 + k*d1
+        D2 = 1 + k*d2
+        V1 = r1/D1 # Vss
+        V2 = r2/D2 # Vll
+        net = V2 - V1
+        x = m*net
+    
+        # -log(p) of the observed choices (and, for the derivatives, the 
+        # residual and the softmax curvature)
+        if not order:
+            return npsum(choiceloss(x, y), 1)
+        loss, r, w = choiceloss(x, y, order)
+        nll = npsum(loss, 1)
+    
+        # derivatives of V2-V1 with respect to k
+        netk  = r1*d1/D1**2 - r2*d2/D2**2
+        netkk = 2*r2*d2**2/D2**3 - 2*r1*d1**2/D1**3
+    
+        g = numpy.empty((len(km), 2))
+        g[:,0] = npsum(r*m*netk, 1)
+        g[:,1] = npsum(r*net, 1)
+    
+        H = numpy.empty((len(km), 2, 2))
+        H[:,0,0] = npsum(w*(m*netk)**2 + r*m*netkk, 1)
+        H[:,0,1] = npsum(w*m*netk*net + r*netk, 1)
+        H[:,1,0] = H[:,0,1]
+        H[:,1,1] = npsum(w*net**2, 1)
+    
+        return nll, g, H
 
-    # output k, m, and loglikelihood
-    return km[0], km[1], -1*LL, res
+    def surface(self, ks=None, ms=None, chunk=2**22):
+        '''
+        Scores -1*loglikelihood over a grid of k (rows) and m (columns) 
+        values. By default k is log-spaced over 1e-4..1 and m over 1e-2..200.
+        The grid is broadcast against the trial matrix, chunk cells x trials
+        at a time.
+        Returns (ks, ms, nll) with nll[i,j] the -LL at (ks[i], ms[j]).
+        '''
+    
+        import numpy
+    
+        if ks is None:
+            ks = numpy.logspace(-4, 0, 81)
+        if ms is None:
+            ms = numpy.logspace(-2, numpy.log10(200), 61)
+        ks = numpy.asarray(ks, dtype=float)
+        ms = numpy.asarray(ms, dtype=float)
+    
+        kk, mm = numpy.meshgrid(ks, ms, indexing='ij')
+        km = numpy.column_stack((kk.ravel(), mm.ravel()))
+        step = max(1, chunk // max(1, len(self.data)))
+        nll = numpy.concatenate([self.error(km[i:i+step]) 
+                                 for i in range(0, len(km), step)])
+    
+        return ks, ms, nll.reshape(kk.shape)
+
+    def fit(self, nstarts=1000, maxiter=10000, adaptive=False, tol=1e-6, 
+            minstarts=20, nrepeat=10, patience=100, batchsize=20, 
+            init='random', npolish=5, seed=None, hook=None):
+        '''
+        Maximum likelihood fit, returns (k, m, LL, res) like fitk. seed (an
+        int or a numpy RandomState) makes the random starts reproducible 
+        without touching numpy's global random state. res.telemetry records
+        the cost of the fit (see the module help); hook, if given, is called
+        with it when the fit is done (e.g. a TelemetryLog).
+        '''
+        
+        import numpy, time
+        
+        # make some shortcuts
+        concat  = numpy.concatenate
+        if seed is None:
+            nprand = numpy.random.rand
+        elif isinstance(seed, numpy.random.RandomState):
+            nprand = seed.rand
+        else:
+            nprand = numpy.random.RandomState(seed).rand
+    
+        lb, ub = zip(*self.bounds)
+        
+        # count the vectorized likelihood and derivative calls
+        calls = [0, 0]
+        def error(km, order=0):
+            calls[order > 0] += 1
+            return self.error(km, order)
+        start = time.time()
+    
+        # with grid initialization only the best few cells of the likelihood 
+        # surface are polished by the optimizer
+        gridtime = 0.
+        if init == 'grid':
+            surface = self.surface()
+            gridtime = time.time() - start
+            ks, ms, nll = surface
+            cells = numpy.argsort(nll, axis=None)[:npolish]
+            ik, im = numpy.unravel_index(cells, nll.shape)
+            grid0 = numpy.column_stack((ks[ik], ms[im]))
+            nstarts = batchsize = len(grid0)
+        elif init != 'random':
+            raise ValueError("init must be 'random' or 'grid', not %r" % (init,))
+
+        # without adaptive stopping all starts go in a single batch, otherwise
+        # small batches are run until the best -LL has been found nrepeat times 
+        # (within tol) or patience starts went by without improving it
+        if not adaptive:
+            batchsize = nstarts
+        res = None
+        LL = numpy.inf
+        since = 0
+        used = 0
+        while used < nstarts:
+        
+            # pick random initial values, one row per start
+            n = min(batchsize, nstarts - used)
+            if init == 'grid':
+                km0 = grid0
+            else:
+                lo, hi = numpy.log(self.startranges).T
+                km0 = numpy.exp(lo + (hi - lo) * nprand(n, 2))
+    
+            # optimize all starting points of the batch together
+            bres = batchmin(error, km0, lb, ub, maxiter=maxiter)
+            if res is None:
+                res = bres
+            else:
+                for key in bres:
+                    res[key] = concat((res[key], bres[key]))
+            used = used + n
+        
+            # check whether the new starts improved on the best -LL
+            fin = numpy.isfinite(bres.fun)
+            bbest = bres.fun[fin].min() if fin.any() else numpy.inf
+            if bbest < LL - tol:
+                since = 0
+            else:
+                since = since + n
+            LL = min(LL, bbest)
+            nhits = numpy.sum(res.fun <= LL + tol)
+            if used >= minstarts and (nhits >= nrepeat or since >= patience):
+                break
+
+        # keep the start with the lowest -loglikelihood, ignoring failed ones
+        fin = numpy.isfinite(res.fun)
+        if not fin.any():
+            raise RuntimeError('no starting point gave a finite likelihood')
+        best = numpy.nanargmin(numpy.where(fin, res.fun, numpy.nan))
+        km = res.xs[best]
+        LL = res.fun[best]
+        res.x = km
+        res.fun = LL
+        res.best = best
+        res.nstarts = used
+        res.nhits = nhits
+        if init == 'grid':
+            res.surface = surface
+        res.telemetry = FitResult(ntrials=len(self.data), nstarts=used,
+                                  ncalls=calls[0], ngradcalls=calls[1],
+                                  nfev=res.nfev.sum(), ngev=res.ngev.sum(),
+                                  time=time.time() - start, gridtime=gridtime,
+                                  starttime=res.time,
+                                  nnonfinite=numpy.sum(~fin), best=best)
+        if hook is not None:
+            hook(res.telemetry)
+
+        # output k, m, and loglikelihood
+        return km[0], km[1], -1*LL, res
+
+    def plot(self, km):
+        '''
+        Make various fit diagnostic plots in a new figure, which is returned.
+        '''
+    
+        import numpy
+        import matplotlib.pyplot as plt
+        
+        # make some shortcuts
+        npmax   = numpy.amax
+        plot    = plt.plot
+        subplot = plt.subplot
+        nparray = numpy.array
+        nprange = numpy.arange
+        axis    = plt.axis
+        npmin   = numpy.amin
+        npexp   = numpy.exp
+
+        d  = self.data
+
+        # get range of x axis
+        maxd1 = npmax(d[:,1])
+        maxd2 = npmax(d[:,3])
+        mind1 = npmin(d[:,1])
+        mind2 = npmin(d[:,3])
+        mind  =  npmin(nparray([mind1, mind2]))
+        maxd  =  npmax(nparray([maxd1, maxd2]));
 
-#    # make a summary plot
-#    plotFit(km)
+        # make a smooth delay range from 0
+        t = nprange(0, maxd, .1)
 
-def errorfit(km):
+        # open a new figure
+        fig = plt.figure()    
     
-    #d = fitkd
+        subplot(1,3,1)
+        plot(t, 1/(1+km[0]*t), '-k')
+        plt.xlabel('t')
+        plt.title('1/(1+kt)') #y.labels get crowded
+    
+        # make arrays of delays and discounted values
+        ss = self.ss
+        delayss =  (d[ss,1], d[ss,3])
+        valss   =  ( d[ss,0]/(1+km[0]*d[ss,1]), d[ss,2]/(1+km[0]*d[ss,3]) ) 
+        ll = self.lls
+        delayll =  (d[ll,1], d[ll,3])
+        valll   =  ( d[ll,0]/(1+km[0]*d[ll,1]), d[ll,2]/(1+km[0]*d[ll,3]) ) 
+   
+        # one line per choice type, trials separated by nan (one artist
+        # instead of one per trial draws much faster)
+        def pairs(x):
+            return numpy.column_stack(x + (numpy.full(len(x[0]), numpy.nan),)).ravel()
+
+        subplot(1,3,2)
+        plot( pairs(delayss), pairs(valss), 'o-r')
+        axis([0, npmax(delayss), 0, npmax(valss)])
+        plot( pairs(delayll), pairs(valll), 'o-b')
+        axis([0, npmax(delayll), 0, npmax(valll)])
+        plt.xlabel('t')
+        plt.title('SV') #y.labels get crowded
+    
+        # discounted values based on current k guess
+        V1 = d[:,0]/(1 + km[0]*d[:,1]) # Vss
+        V2 = d[:,2]/(1 + km[0]*d[:,3]) # Vll
+        netval = V2-V1
+    
+        # p of choosing ll (ll=2)
+        pll = 1/(1+ npexp(-km[1]*(V2-V1))) 
+    
+        subplot(1,3,3)
+        plot( netval, pll, 'og')
+        plot( netval[ss], d[ss,4], 'or')
+        plot( netval[ll], d[ll,4], 'ob')
+        plt.xlabel('V(ll)-V(ss)')
+        plt.title('p(ll)') #y.labels get crowded
+        return fig
+
+def fitk(data, **opts):
     '''
-    Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting.
+    Fits the trial matrix data, see the module help and KFitter.fit for the
+    options.
+    '''
+    
+    return KFitter(data).fit(**opts)
+
+class TelemetryLog(object):
+    '''
+    Collects the telemetry of many fits, as the hook of KFitter.fit or the
+    telemetry of fitcohort. Keyword tags given with a record (fitcohort
+    gives the subject) are kept with it.
+    '''
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, telemetry, **tags):
+        rec = FitResult(telemetry)
+        rec.update(tags)
+        self.records.append(rec)
+
+    def table(self):
+        '''
+        One array per scalar entry (and tag) with one value per fit. The
+        per-start times are left out.
+        '''
+
+        import numpy
+
+        keys = set()
+        for rec in self.records:
+            keys.update(rec)
+        keys.discard('starttime')
+        return FitResult((key, numpy.array([rec.get(key) for rec in self.records]))
+                         for key in sorted(keys))
+
+    def summary(self):
+        '''
+        Totals over all fits and the fit (position in records) that took
+        the longest.
+        '''
+
+        import numpy
+
+        tab = self.table()
+        return FitResult(nfits=len(self.records), time=tab.time.sum(),
+                         meantime=tab.time.mean(), ncalls=tab.ncalls.sum(),
+                         ngradcalls=tab.ngradcalls.sum(), nfev=tab.nfev.sum(),
+                         ngev=tab.ngev.sum(), nnonfinite=tab.nnonfinite.sum(),
+                         slowest=numpy.argmax(tab.time))
+
+def fitcohort(datasets, nworkers=None, seed=0, progress=True, cache=None, 
+              telemetry=None, **opts):
+    '''
+    Fits a list of trial matrices (one per subject) in a pool of nworkers 
+    processes (all cores by default, 1 fits in this process). Subject i is 
+    fitted with its own random stream seeded by (seed, i), so the results do
+    not depend on the number of workers. opts are passed to KFitter.fit. 
+    With a FitCache as cache, subjects whose data and settings are cached 
+    are not refitted. telemetry, if given, is called with the telemetry of
+    every fitted subject and subject=i (e.g. a TelemetryLog). Returns an 
+    (n_subjects, 3) array of (k, m, LL) in input order.
+    '''
+    
+    import numpy, sys
+    
+    params = numpy.empty((len(datasets), 3))
+    
+    # take what is already known from the cache
+    keys = [None] * len(datasets)
+    todo = range(len(datasets))
+    if cache is not None:
+        todo = []
+        for i, data in enumerate(datasets):
+            keys[i] = cache.key(data, **opts)
+            hit = cache.getfit(keys[i])
+            if hit is None:
+                todo.append(i)
+            else:
+                params[i] = hit.x[0], hit.x[1], -hit.fun
+    
+    jobs = [(i, datasets[i], (seed, i), opts) for i in todo]
+    done = 0
+    for i, k, m, LL, res in poolmap(_fitjob, jobs, nworkers):
+        params[i] = k, m, LL
+        if cache is not None:
+            cache.putfit(keys[i], res)
+        if telemetry is not None:
+            telemetry(res.telemetry, subject=i)
+        done = done + 1
+        if progress:
+            sys.stdout.write('\rfitted %d/%d subjects' % (done, len(jobs)))
+            sys.stdout.flush()
+    if progress:
+        sys.stdout.write('\n')
+    
+    return params
+
+def _fitjob(job):
+    '''
+    Fits one subject for fitcohort.
+    '''
+    
+    import numpy
+    
+    i, data, seed, opts = job
+    k, m, LL, res = KFitter(data).fit(seed=numpy.random.RandomState(seed), 
+                                      **opts)
+    return i, k, m, LL, res
+
+def bootk(data, nboot=1000, alpha=.05, nworkers=None, batchsize=250, seed=0,
+          km=None):
+    '''
+    Bootstrap confidence intervals for k and m. Trials are resampled with 
+    replacement nboot times and every replicate is fitted starting from the 
+    full-data optimum km (fitted with a grid start if not given). Replicates
+    are fitted batchsize at a time, all of a batch in one vectorized
+    optimization, and batches are spread over a pool of nworkers processes.
+    Batch b draws its replicates from a random stream seeded by (seed, b), so
+    results don't depend on nworkers. Returns a FitResult with the full-data
+    k, m and LL, the (1-alpha) percentile intervals kci and mci, and the 
+    (nboot, 2) bootstrap distribution of (k, m) as boot.
     '''
     
     import numpy
     
+    data = numpy.asarray(data, dtype=float)
+    if km is None:
+        km = KFitter(data).fit(init='grid')[:2]
+    km = numpy.asarray(km, dtype=float)
+    
+    sizes = [min(batchsize, nboot - b) for b in range(0, nboot, batchsize)]
+    jobs = [(b, data, km, n, (seed, b)) for b, n in enumerate(sizes)]
+    boot = [None] * len(jobs)
+    for b, bkm in poolmap(_bootjob, jobs, nworkers):
+        boot[b] = bkm
+    boot = numpy.concatenate(boot)
+    
+    pct = [100*alpha/2, 100*(1 - alpha/2)]
+    ci = numpy.nanpercentile(boot, pct, axis=0)
+    
+    return FitResult(k=km[0], m=km[1], LL=-KFitter(data).errorfit(km), 
+                     kci=ci[:,0], mci=ci[:,1], boot=boot, alpha=alpha)
+
+def _bootjob(job):
+    '''
+    Fits one batch of bootstrap replicates for bootk.
+    '''
+    
+    import numpy
+    from GroupFitK import GroupFitter
+    
+    b, data, km, n, seed = job
+    rng = numpy.random.RandomState(seed)
+    ntrials = len(data)
+    
+    # stack the resampled trials with the replicate as the subject
+    rows = rng.randint(0, ntrials, (n, ntrials))
+    gf = GroupFitter(data[rows.ravel()], numpy.repeat(numpy.arange(n), ntrials))
+    
+    # warm start every replicate from the full data optimum
+    lb, ub = zip(*gf.logbounds)
+    u0 = numpy.tile(numpy.log(numpy.maximum(km, 1e-300)), (n, 1))
+    res = batchmin(gf.logerror, u0, lb, ub, indexed=True)
+    bkm = numpy.exp(res.xs)
+    bkm[~res.success] = numpy.nan
+    
+    return b, bkm
+
+def poolmap(func, jobs, nworkers=None):
+    '''
+    Yields func(job) for every job, in order of completion, computed in a
+    pool of nworkers processes (all cores by default, 1 runs them here).
+    '''
+    
+    import multiprocessing
+    
+    if nworkers == 1:
+        for job in jobs:
+            yield func(job)
+        return
+    
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        for out in pool.imap_unordered(func, jobs):
+            yield out
+    finally:
+        pool.close()
+        pool.join()
+
+def batchmin(fun, x0, lb, ub, maxiter=10000, ftol=1e-12, indexed=False):
+    '''
+    Minimizes fun from many starting points at once with bounded, damped 
+    Newton steps. x0 holds one starting point per row. fun(x, 0) returns the
+    function values for every row of x and fun(x, 2) also returns the (n, p)
+    gradients and (n, p, p) Hessians. All starts advance together, so each
+    iteration is one vectorized call to fun. Starts with a value that is not
+    finite are dropped, like the failed starts of a serial multistart.
+    With indexed=True fun is called as fun(x, order, rows), where rows are 
+    the row numbers in x0 of the rows of x (e.g. to pick each row's data).
+    Besides the solutions (xs) and values (fun), the result counts the
+    function (nfev) and derivative (ngev) evaluations of every start and its
+    share of the wall time (time).
+    '''
+    
+    import numpy, time
+    
     # make some shortcuts
-    concat  = numpy.concatenate
-    nplog   = numpy.log
-    npexp   = numpy.exp
-    npnot   = numpy.logical_not
+    npclip  = numpy.clip
     npsum   = numpy.sum
-            
-    # discounted values based on current k guess
-    V1 = d[:,0]/(1 + km[0]*d[:,1]) # Vss
-    V2 = d[:,2]/(1 + km[0]*d[:,3]) # Vll
+    isfin   = numpy.isfinite
+    solve   = numpy.linalg.solve
+
+    lb = numpy.asarray(lb, dtype=float)
+    ub = numpy.asarray(ub, dtype=float)
+    x  = npclip(numpy.array(x0, dtype=float), lb, ub)
+    n, p = x.shape
+    if not indexed:
+        call = lambda x, order, rows: fun(x, order)
+    else:
+        call = fun
     
-    # p of choosing ll (ll=2)
-    pll = 1/(1+ npexp(-km[1]*(V2-V1))) 
+    # the wall time of every vectorized step is shared out over the rows in it
+    tic  = time.time()
+    f    = call(x, 0, numpy.arange(n))
+    nit  = numpy.zeros(n, dtype=int)
+    nfev = numpy.ones(n, dtype=int)
+    ngev = numpy.zeros(n, dtype=int)
+    conv = numpy.zeros(n, dtype=bool)
+    cost = numpy.repeat((time.time() - tic) / max(n, 1), n)
+    eye  = numpy.eye(p)
     
-    # boolean of ll choices
-    lls = d[:,4]==1 
+    # rows still being optimized
+    work = numpy.flatnonzero(isfin(f))
+    it = 0
+    while work.size and it < maxiter:
+        
+        tic = time.time()
+        xw = x[work]
+        fw, gw, hw = call(xw, 2, work)
+        nfev[work] += 1
+        ngev[work] += 1
+        
+        # starts with broken derivatives can not move any further
+        good = isfin(gw).all(1) & isfin(hw).all(2).all(1)
+        if not good.all():
+            f[work[~good]] = numpy.inf
+            cost[work[~good]] += (time.time() - tic) / work.size
+            work, xw, fw, gw, hw = work[good], xw[good], fw[good], gw[good], hw[good]
+            if not work.size:
+                break
+        
+        # variables pushed against a bound by the gradient stay where they are
+        held = ((xw <= lb) & (gw > 0)) | ((xw >= ub) & (gw < 0))
+        free = ~held
+        hw = hw * (free[:,:,None] & free[:,None,:]) + eye * held[:,:,None]
+        gf = gw * free
+        
+        # newton direction where the hessian is positive definite, otherwise
+        # a gradient step scaled by the curvature of each variable
+        dg = numpy.abs(hw[:,numpy.arange(p),numpy.arange(p)])
+        dg[dg == 0] = 1
+        eig = numpy.linalg.eigvalsh(hw)
+        pd = eig[:,0] > 1e-12 * numpy.abs(eig[:,-1])
+        dirs = -gf / dg
+        if pd.any():
+            dirs[pd] = -solve(hw[pd], gf[pd][:,:,None])[:,:,0]
+        
+        # backtracking line search along the projected path
+        t  = numpy.ones(work.size)
+        xn = xw.copy()
+        fn = fw.copy()
+        moved = numpy.zeros(work.size, dtype=bool)
+        pend = numpy.arange(work.size)
+        for _ in range(40):
+            xt = npclip(xw[pend] + t[pend,None] * dirs[pend], lb, ub)
+            ft = call(xt, 0, work[pend])
+            nfev[work[pend]] += 1
+            dec = numpy.minimum(npsum(gw[pend] * (xt - xw[pend]), 1), 0)
+            ok = isfin(ft) & (ft <= fw[pend] + 1e-4 * dec)
+            xn[pend[ok]] = xt[ok]
+            fn[pend[ok]] = ft[ok]
+            moved[pend[ok]] = True
+            pend = pend[~ok]
+            if not pend.size:
+                break
+            t[pend] = t[pend] * .5
+        
+        # a start is done when it can not decrease -LL in any meaningful way
+        done = ~moved | (fw - fn <= ftol * numpy.maximum(1, numpy.abs(fw)))
+        x[work] = xn
+        f[work] = fn
+        nit[work] += 1
+        conv[work[done]] = True
+        cost[work] += (time.time() - tic) / work.size
+        work = work[~done]
+        it = it + 1
 
-    # penalize contradictions (ll and pll=0 or ss and pll=1)
-    if 0 in pll[lls] or 1 in pll[npnot(lls)]:
-        loglik = float('inf') # maximum float, avoids inf errors
-    else:
-        loglik = npsum(  nplog( concat( ( pll[lls], 1-pll[npnot(lls)] ) ) ) )
-            
-    return  -1*loglik
+    return FitResult(xs=x, fun=f, nit=nit, nfev=nfev, ngev=ngev, time=cost,
+                     converged=conv, success=conv & isfin(f))
+
+def gridsurface(data, ks=None, ms=None, chunk=2**22):
+    '''
+    -1*loglikelihood over a (k, m) grid, see KFitter.surface.
+    '''
+    
+    return KFitter(data).surface(ks, ms, chunk)
 
-def plotfit(km):
+def errorfit(km, data):
+    '''
+    Computes -1*loglikelihood of softmax fit assuming hyperbolic discounting.
+    '''
     
-    #d = fitkd
+    return KFitter(data).errorfit(km)
+
+def errorgrad(km, data):
+    '''
+    Gradient of errorfit with respect to (k, m).
+    '''
+    
+    return KFitter(data).errorgrad(km)
+
+def errorhess(km, data):
+    '''
+    Hessian of errorfit with respect to (k, m).
+    '''
+    
+    return KFitter(data).errorhess(km)
+
+def plotfit(km, data):
     '''
     Make various fit diagnostic plots.
     '''
     
+    return KFitter(data).plot(km)
+
+def plotsurface(surface, km=None):
+    
+    '''
+    Plot the -loglikelihood surface returned by gridsurface (or res.surface),
+    optionally marking the fitted (k, m).
+    '''
+    
     import numpy
     import matplotlib.pyplot as plt
-        
-    # make some shortcuts
-    npmax   = numpy.amax
-    plot    = plt.plot
-    subplot = plt.subplot
-    nparray = numpy.array
-    nprange = numpy.arange
-    axis    = plt.axis
-    npmin   = numpy.amin
-    npexp   = numpy.exp
-
-
-    # get range of x axis
-    maxd1 = npmax(d[:,1])
-    maxd2 = npmax(d[:,3])
-    mind1 = npmin(d[:,1])
-    mind2 = npmin(d[:,3])
-    mind  =  npmin(nparray([mind1, mind2]))
-    maxd  =  npmax(nparray([maxd1, maxd2]));
-
-    # make a smooth delay range from 0
-    t = nprange(0, maxd, .1)
-
+    
+    ks, ms, nll = surface
+    
     # open a new figure
-    plt.figure()    
-    
-    subplot(1,3,1)
-    plot(t, 1/(1+km[0]*t), '-k')
-    plt.xlabel('t')
-    plt.title('1/(1+kt)') #y.labels get crowded
-    
-    # make arrays of delays and discounted values
-    ss = d[:,4] == 0
-    delayss =  (d[ss,1], d[ss,3])
-    valss   =  ( d[ss,0]/(1+km[0]*d[ss,1]), d[ss,2]/(1+km[0]*d[ss,3]) ) 
-    ll = d[:,4] == 1
-    delayll =  (d[ll,1], d[ll,3])
-    valll   =  ( d[ll,0]/(1+km[0]*d[ll,1]), d[ll,2]/(1+km[0]*d[ll,3]) ) 
-   
-    subplot(1,3,2)
-    plot( delayss, valss, 'o-r')
-    axis([0, npmax(delayss), 0, npmax(valss)])
-    plot( delayll, valll, 'o-b')
-    axis([0, npmax(delayll), 0, npmax(valll)])
-    plt.xlabel('t')
-    plt.title('SV') #y.labels get crowded
-    
-    # discounted values based on current k guess
-    V1 = d[:,0]/(1 + km[0]*d[:,1]) # Vss
-    V2 = d[:,2]/(1 + km[0]*d[:,3]) # Vll
-    netval = V2-V1
-    
-    # p of choosing ll (ll=2)
-    pll = 1/(1+ npexp(-km[1]*(V2-V1))) 
-    
-    subplot(1,3,3)
-    plot( netval, pll, 'og')
-    plot( netval[ss], d[ss,4], 'or')
-    plot( netval[ll], d[ll,4], 'ob')
-    plt.xlabel('V(ll)-V(ss)')
-    plt.title('p(ll)') #y.labels get crowded
+    plt.figure()
+    
+    plt.pcolormesh(numpy.log10(ms), numpy.log10(ks), nll, shading='auto')
+    plt.colorbar()
+    if km is not None:
+        plt.plot(numpy.log10(km[1]), numpy.log10(km[0]), '+w', markersize=12)
+    plt.xlabel('log10(m)')
+    plt.ylabel('log10(k)')
+    plt.title('-LL')
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-This script generates 160 offers for an intertemporal choice experiment. The 
+This script generates 160 offers for an intertemporal choice experiment. The
 trials are generated such that one of the offers is always specified a priori
-and the other is adjusted to satisfy a choice probability constraint. The 
-specifications can be changed to satisfy whatever delay, amount, and choice 
+and the other is adjusted to satisfy a choice probability constraint. The
+specifications can be changed to satisfy whatever delay, amount, and choice
 probability parameters are desired. Below are the params currently implemented.
 
 Fixed offers:
@@ -15,12 +15,17 @@ Probability adjusted offers:
 Delays: 0-15 days for SS; 30 to 60 days for LL
 P(LL): .1, .4, .6, .9
 
+The offers can also be made from other scripts with genoffers(k, m), for a
+whole cohort at once with batchoffers, and written with writeoffers. Run with
+subject numbers as arguments the script writes the offers of all of them
+from their fitted parameters (see cohortoffers) without asking.
+
 Created on Wed Sep 17 20:21:11 2014
 @author: christianrodriguez
 """
 
 # set parameters
-ssa  = 20 
+ssa  = 20
 ssd1 = 0
 ssd2 = 15
 lla  = 40
@@ -28,65 +33,151 @@ lld1 = 15
 lld2 = 60
 pll  = [.1, .4, .6, .9]
 tsperbin = 40
+minamnt  = 1      # smallest adjusted ss amount
+maxamnt  = 100    # largest adjusted ll amount
+maxtries = 20     # delay draws for offers outside the amount constraints
 
 # specify directories
 datdir    = '/Users/christianrodriguez/Dropbox/Python/data'
 paramsdir = '/Users/christianrodriguez/Dropbox/Python/data/fitted'
 offersdir = '/Users/christianrodriguez/Dropbox/Python/data/offers'
 
-import os 
+import os
 import numpy as np
 
-# make sure offersdir exists
-if  not os.path.isdir(offersdir):
-    os.mkdir(offersdir)
-
-# ask for subject number and get choice parameters
-subn = input('Which subject do you want to run?  ')
-# fill in with a leading zero for file name
-subn = subn.__str__().zfill(2)
-fitfilen = '%s/%s_fitkparams.txt' % (paramsdir, subn)
-kmll = np.genfromtxt(fitfilen, delimiter=',', skip_header=1)
-k = kmll[0]
-m = kmll[1]
-ll = kmll[2]
-
-# make fixed offers
-sss   = np.array(np.ones((tsperbin*2,1)))*ssa
-sssd1 = np.array(np.ones((tsperbin,1)))*ssd1
-sssd2 = np.array(np.ones((tsperbin,1)))*ssd2
-fss   = np.concatenate((sss,np.concatenate((sssd1,sssd2),0)),1)
-
-lls   = np.array(np.ones((tsperbin*2,1)))*lla
-llsd1 = np.array(np.ones((tsperbin,1)))*lld1
-llsd2 = np.array(np.ones((tsperbin,1)))*lld2
-fll   = np.concatenate((lls,np.concatenate((llsd1,llsd2),0)),1)
-
-# make probability adjusted offers
-ps  = np.tile(pll, len(fss)/len(pll))
-# first for fixed ss trials
-pss = np.zeros((len(fss), 2))
-row = 0
-while row < len(pss): 
-    svss  = fss[row,0]/(1+k*fss[row,1])           # hyperbolic discounted value
-    psvll = svss - np.log(1/ps[row]-1)/m                # softmax value for ll 
-    pss[row, 1] = np.random.randint(lld1 +1, high=lld2)    # delay of ll offer
-    # add a day to the minimum p adjusted ll, to prevent trivial offers    
-    pss[row, 0] = round(psvll + psvll*k*pss[row, 1], 2) # amount of ll offer
-    row = row + 1
-fsstrials = np.concatenate((fss,pss),1)
-# then for fixed ll trials
-pll = np.zeros((len(fll), 2))
-row = 0
-while row < len(pll): 
-    svll  = fll[row,0]/(1+k*fll[row,1])           # hyperbolic discounted value
-    psvss = svll + np.log(1/ps[row]-1)/m                # softmax value for ss 
-    pll[row, 1] = np.random.randint(ssd1, high=ssd2)    # delay of ss offer
-    pll[row, 0] = round(psvss + psvss*k*pll[row, 1], 2) # amount of ss offer
-    row = row + 1
-flltrials = np.concatenate((fll,pll),1)
-
-# collect all trials, shuffle and store in file for experiment
-offers = np.random.permutation(np.concatenate((fsstrials, flltrials)))
-np.savetxt('%s/%s_offers.txt' % (offersdir, subn), offers, delimiter=',',
-           fmt='%.2f',header='"famnt","fdelay","pamnt","pdelay"')
+def batchoffers(k, m, seeds=None):
+    '''
+    Offers for many subjects at once. k and m hold the discounting parameters
+    of every subject and seeds, if given, one random seed per subject (the
+    global numpy random state is used otherwise). Returns the shuffled
+    (n, 160, 4) array of offers [famnt fdelay pamnt pdelay] and an (n, 160)
+    boolean array that is False where no delay gave an amount within the
+    constraints and the amount was clipped to them.
+
+    Adjusted larger later amounts must be above ssa and at most maxamnt, and
+    adjusted smaller sooner amounts at least minamnt and below lla, so no
+    offer is negative, absurd or dominated by the fixed one. The delays of
+    violating offers are redrawn (up to maxtries draws, all made at once).
+    '''
+
+    k = np.asarray(k, dtype=float).reshape(-1, 1, 1)
+    m = np.asarray(m, dtype=float).reshape(-1, 1, 1)
+    n = len(k)
+    nt = tsperbin*2
+
+    # make fixed offers
+    fss = np.column_stack((np.repeat(ssa, nt), np.repeat((ssd1, ssd2), tsperbin)))
+    fll = np.column_stack((np.repeat(lla, nt), np.repeat((lld1, lld2), tsperbin)))
+    ps  = np.tile(pll, nt//len(pll))
+
+    # draw all delays and orders, per subject if seeds are given
+    if seeds is None:
+        rngs = [(np.random, n)]
+    else:
+        rngs = [(np.random.RandomState(s), 1) for s in seeds]
+    lldels, ssdels, keys = [], [], []
+    for rng, c in rngs:
+        # add a day to the minimum p adjusted ll, to prevent trivial offers
+        lldels.append(rng.randint(lld1 +1, lld2, size=(c, maxtries, nt)))
+        ssdels.append(rng.randint(ssd1, ssd2, size=(c, maxtries, nt)))
+        keys.append(rng.rand(c, 2*nt))
+    lldels = np.concatenate(lldels)
+    ssdels = np.concatenate(ssdels)
+    perm = np.argsort(np.concatenate(keys), 1)
+
+    def adjust(sv, sign, dels, lo, hi):
+        # softmax value for the adjusted offer, and its amount for every draw
+        psv  = sv + sign*np.log(1/ps-1)/m
+        amts = np.round(psv*(1 + k*dels), 2)
+        ok   = (amts >= lo) & (amts <= hi)
+        # keep the first draw within the constraints, clip if there is none
+        first = np.argmax(ok, 1)[:,None]
+        amts  = np.take_along_axis(amts, first, 1)[:,0]
+        dels  = np.take_along_axis(dels, first, 1)[:,0]
+        return np.clip(amts, lo, hi), dels, ok.any(1)
+
+    # first for fixed ss trials, then for fixed ll trials
+    svss = fss[:,0]/(1+k*fss[:,1])               # hyperbolic discounted value
+    pssa, pssd, okss = adjust(svss, -1, lldels, ssa + .01, maxamnt)
+    svll = fll[:,0]/(1+k*fll[:,1])               # hyperbolic discounted value
+    plla, plld, okll = adjust(svll, 1, ssdels, minamnt, lla - .01)
+
+    # collect all trials and shuffle
+    offers = np.empty((n, 2*nt, 4))
+    offers[:,:nt,:2] = fss
+    offers[:,nt:,:2] = fll
+    offers[:,:,2] = np.concatenate((pssa, plla), 1)
+    offers[:,:,3] = np.concatenate((pssd, plld), 1)
+    ok = np.concatenate((okss, okll), 1)
+    rows = np.arange(n)[:,None]
+    return offers[rows, perm], ok[rows, perm]
+
+def genoffers(k, m, seed=None):
+    '''
+    Returns the shuffled (160, 4) array of offers [famnt fdelay pamnt pdelay]
+    for hyperbolic discounting parameters k and m (see batchoffers). Warns
+    with the number of offers whose amount had to be clipped, which then
+    miss their p(ll).
+    '''
+
+    import warnings
+
+    offers, ok = batchoffers([k], [m], None if seed is None else [seed])
+    if not ok[0].all():
+        warnings.warn('%d of %d offers for k = %g, m = %g were clipped to the '
+                      'amount constraints and miss their p(ll)' %
+                      (np.sum(~ok[0]), ok.shape[1], k, m))
+    return offers[0]
+
+def writeoffers(offers, subn, offersdir=offersdir):
+    '''
+    Stores the offers in the file read by the experiment.
+    '''
+
+    # make sure offersdir exists
+    if  not os.path.isdir(offersdir):
+        os.mkdir(offersdir)
+
+    np.savetxt('%s/%s_offers.txt' % (offersdir, subn), offers, delimiter=',',
+               fmt='%.2f',header='"famnt","fdelay","pamnt","pdelay"')
+
+def cohortoffers(subns, params=None, seeds=None, paramsdir=paramsdir,
+                 offersdir=offersdir):
+    '''
+    Makes and writes the offers of every subject in subns. params is an
+    (n, 2) array of k and m; by default they are read from the
+    _fitkparams.txt file of every subject. Returns what batchoffers returns.
+    '''
+
+    subns = [str(s).zfill(2) for s in subns]
+    if params is None:
+        params = [np.genfromtxt('%s/%s_fitkparams.txt' % (paramsdir, s),
+                                delimiter=',', skip_header=1)[:2] for s in subns]
+    params = np.asarray(params, dtype=float)
+
+    offers, ok = batchoffers(params[:,0], params[:,1], seeds)
+    for subn, suboffers in zip(subns, offers):
+        writeoffers(suboffers, subn, offersdir)
+    return offers, ok
+
+if __name__ == '__main__':
+
+    import sys
+
+    if len(sys.argv) > 1:
+        # make the offers of all subjects given as arguments
+        offers, ok = cohortoffers(sys.argv[1:])
+        sys.exit()
+
+    # ask for subject number and get choice parameters
+    subn = input('Which subject do you want to run?  ')
+    # fill in with a leading zero for file name
+    subn = subn.__str__().zfill(2)
+    fitfilen = '%s/%s_fitkparams.txt' % (paramsdir, subn)
+    kmll = np.genfromtxt(fitfilen, delimiter=',', skip_header=1)
+    k = kmll[0]
+    m = kmll[1]
+    ll = kmll[2]
+
+    # make the offers and store in file for experiment
+    writeoffers(genoffers(k, m), subn)
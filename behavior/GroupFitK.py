@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: res = groupfitk(data, subj)
+   or: res = GroupFitter(data, subj).hierarchical()
+
+Fits the hyperbolic-softmax model of FitK to many subjects at once. data
+holds the trials of all subjects stacked in rows with columns
+  [r1 d1 r2 d2 choice]
+(see FitK) and subj gives the subject of every row. The likelihood of every
+subject is evaluated in one vectorized pass over all trials, with per-subject
+sums taken by numpy.bincount, and all subjects are optimized together by
+FitK.batchmin.
+
+Three kinds of fit are available:
+  pooled        one (k, m) for all trials, returns (k, m, LL, res) like fitk
+  separate      maximum likelihood (k, m) for every subject
+  hierarchical  per-subject (k, m) with a lognormal population distribution,
+                estimated with EM and a Laplace approximation. res.mu and
+                res.sd are the population mean and sd of (log k, log m).
+
+@author: christianrodriguez
+"""
+
+from math import log
+from FitK import KFitter, FitResult, batchmin, choiceloss, trialcolumns
+
+class Segments(object):
+    '''
+    Subject index of stacked trials. Subjects are numbered in the order of
+    numpy.unique(subj) and the trials of each subject are located once, so
+    the trials of any set of subjects can be picked without scanning all
+    rows.
+    '''
+
+    def __init__(self, subj):
+
+        import numpy
+
+        self.subjects, self.idx = numpy.unique(subj, return_inverse=True)
+        self.nsubj = len(self.subjects)
+        self.ntrials = numpy.bincount(self.idx, minlength=self.nsubj)
+        self.order = numpy.argsort(self.idx, kind='mergesort')
+        self.first = numpy.cumsum(self.ntrials) - self.ntrials
+
+    def select(self, rows=None):
+        '''
+        Returns the trials (as an index or slice) of the subjects in rows
+        (all by default) and, for every one of them, the position of its 
+        subject in rows.
+        '''
+
+        import numpy
+
+        if rows is None:
+            return slice(None), self.idx
+        lens = self.ntrials[rows]
+        pos = numpy.repeat(numpy.arange(len(rows)), lens)
+        start = numpy.repeat(self.first[rows] - (numpy.cumsum(lens) - lens), lens)
+        return self.order[start + numpy.arange(lens.sum())], pos
+
+class GroupFitter(object):
+    '''
+    Hyperbolic-softmax model for the stacked trials of many subjects.
+    Subjects are numbered in the order of numpy.unique(subj).
+    '''
+
+    # bounds on (log k, log m) for the per-subject fits, those of KFitter
+    logbounds = tuple((log(lo), log(hi)) for lo, hi in KFitter.bounds)
+
+    def __init__(self, data, subj):
+
+        self.data, self.r1, self.d1, self.r2, self.d2, self.choice = \
+            trialcolumns(data)
+        self.segments = Segments(subj)
+        self.subjects = self.segments.subjects
+        self.idx = self.segments.idx
+        self.nsubj = self.segments.nsubj
+        self.ntrials = self.segments.ntrials
+
+    def error(self, km, order=0, rows=None):
+        '''
+        -1*loglikelihood of every subject, for an (n_subjects, 2) array of
+        (k, m). With rows, km only holds the subjects listed in rows. With
+        order=2 the gradients and Hessians are also returned, like
+        KFitter.error.
+        '''
+
+        import numpy
+
+        # make some shortcuts
+        bincount  = numpy.bincount
+
+        # pick the trials of the wanted subjects and number them 0..n-1
+        sel, pos = self.segments.select(rows)
+        r1, d1, r2, d2, y = [c[sel] for c in
+                             (self.r1, self.d1, self.r2, self.d2, self.choice)]
+        n = len(km)
+        segsum = lambda w: bincount(pos, weights=w, minlength=n)
+
+        k = km[pos,0]
+        m = km[pos,1]
+
+        # discounted values based on current k guesses
+        D1 = 1 + k*d1
+        D2 = 1 + k*d2
+        net = r2/D2 - r1/D1
+        x = m*net
+
+        # -log(p) of the observed choices, summed within subject (see
+        # FitK.choiceloss)
+        if not order:
+            return segsum(choiceloss(x, y))
+        loss, r, w = choiceloss(x, y, order)
+        nll = segsum(loss)
+
+        # derivatives of V2-V1 with respect to k
+        netk  = r1*d1/D1**2 - r2*d2/D2**2
+        netkk = 2*r2*d2**2/D2**3 - 2*r1*d1**2/D1**3
+
+        g = numpy.empty((n, 2))
+        g[:,0] = segsum(r*m*netk)
+        g[:,1] = segsum(r*net)
+
+        H = numpy.empty((n, 2, 2))
+        H[:,0,0] = segsum(w*(m*netk)**2 + r*m*netkk)
+        H[:,0,1] = segsum(w*m*netk*net + r*netk)
+        H[:,1,0] = H[:,0,1]
+        H[:,1,1] = segsum(w*net**2)
+
+        return nll, g, H
+
+    def logerror(self, u, order=0, rows=None, mu=0, sd=float('inf')):
+        '''
+        Like error, but for u = (log k, log m) plus a normal prior on u with
+        mean mu and sd sd (no prior by default).
+        '''
+
+        import numpy
+
+        km = numpy.exp(u)
+        z = (u - mu) / sd
+        out = self.error(km, order, rows)
+        if not order:
+            return out + .5*numpy.sum(z**2, 1)
+
+        # chain rule from (k, m) to (log k, log m)
+        nll, g, H = out
+        nll = nll + .5*numpy.sum(z**2, 1)
+        gu = km*g + z/sd
+        Hu = km[:,:,None]*km[:,None,:]*H
+        Hu[:,[0,1],[0,1]] += km*g + 1/sd**2
+
+        return nll, gu, Hu
+
+    def pooled(self, **opts):
+        '''
+        One (k, m) for all trials, returns (k, m, LL, res) like FitK.fitk.
+        opts are passed to KFitter.fit.
+        '''
+
+        return KFitter(self.data).fit(**opts)
+
+    def separate(self, starts=None, maxiter=10000, mu=0, sd=float('inf')):
+        '''
+        Maximum likelihood (or, with mu and sd, maximum a posteriori) (k, m)
+        of every subject. All subjects are optimized together from each of
+        the (k, m) starts and the best start is kept per subject.
+        '''
+
+        import numpy
+
+        if starts is None:
+            starts = [(k, m) for k in (.002, .02, .2) for m in (.2, 2)]
+        lb, ub = zip(*self.logbounds)
+        fun = lambda u, order, rows: self.logerror(u, order, rows, mu, sd)
+
+        best = None
+        for km0 in starts:
+            u0 = numpy.tile(numpy.log(km0), (self.nsubj, 1))
+            res = batchmin(fun, u0, lb, ub, maxiter=maxiter, indexed=True)
+            if best is None:
+                best = res
+            else:
+                better = res.fun < best.fun
+                for key in res:
+                    best[key][better] = res[key][better]
+
+        return best
+
+    def hierarchical(self, maxiter=200, tol=1e-4, starts=None):
+        '''
+        Per-subject (k, m) under a lognormal population distribution, fitted
+        by EM: subjects are fitted (MAP) given the population, then the
+        population mean and sd of (log k, log m) are updated from the fits
+        and their Laplace approximated posterior variances.
+        '''
+
+        import numpy
+
+        # start from the separate fits
+        res = self.separate(starts)
+        u = res.xs
+        mu = u.mean(0)
+        sd = numpy.maximum(u.std(0), .1)
+        lb, ub = zip(*self.logbounds)
+
+        it = 0
+        conv = False
+        while it < maxiter and not conv:
+
+            # per-subject MAP estimates, warm started from the last ones
+            fun = lambda x, order, rows: self.logerror(x, order, rows, mu, sd)
+            res = batchmin(fun, u, lb, ub, indexed=True)
+            u = res.xs
+
+            # laplace approximation of each subject's posterior
+            H = self.logerror(u, 2, None, mu, sd)[2]
+            cov = numpy.linalg.inv(H)
+
+            # update the population distribution
+            newmu = u.mean(0)
+            var = numpy.mean((u - newmu)**2 + cov[:,[0,1],[0,1]], 0)
+            newsd = numpy.sqrt(numpy.maximum(var, 1e-6))
+            conv = numpy.all(numpy.abs(newmu - mu) < tol) and \
+                   numpy.all(numpy.abs(newsd - sd) < tol)
+            mu, sd = newmu, newsd
+            it = it + 1
+
+        km = numpy.exp(u)
+        return FitResult(subjects=self.subjects, k=km[:,0], m=km[:,1],
+                         LL=-self.error(km), mu=mu, sd=sd, cov=cov,
+                         niter=it, converged=conv, success=res.success)
+
+def groupfitk(data, subj, fit='hierarchical', **opts):
+    '''
+    Fits the stacked trials of many subjects, fit is 'hierarchical',
+    'separate' or 'pooled' (see GroupFitter).
+    '''
+
+    import numpy
+
+    gf = GroupFitter(data, subj)
+    if fit == 'hierarchical':
+        return gf.hierarchical(**opts)
+    elif fit == 'separate':
+        res = gf.separate(**opts)
+        km = numpy.exp(res.xs)
+        res.subjects = gf.subjects
+        res.k = km[:,0]
+        res.m = km[:,1]
+        res.LL = -gf.error(km)
+        return res
+    elif fit == 'pooled':
+        return gf.pooled(**opts)
+    raise ValueError("fit must be 'hierarchical', 'separate' or 'pooled', "
+                     "not %r" % (fit,))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: sched = Schedule(strtt, now=clock.monotonic_time, wait=lambda ms:
+                  exp.clock.wait(ms, process_control_events=True))
+       fix, first, delay, second, end = wmitctrial(start, fixcprest, foprest,
+                                                   dprest, maxdt)
+       sched.onset('fix', fix, fixcross.present, trial=trial)
+       ...
+       sched.save('onsets.csv')
+   or: python Schedule.py     (simulated run, chained waits vs deadlines)
+
+Deadline-based timing for the scanner tasks. Onsets are absolute deadlines
+in ms from the scanner trigger (strtt) and every event waits until its own
+deadline instead of waiting a duration after the previous event. The
+n-back onsets are all fixed and computed up front (nbackschedule). A WMITC
+trial starts an ITI after the response to the previous one (the actual
+onset of the second offer plus the RT, or the end of the decision window),
+so its deadlines are set when it starts (wmitctrial). Rendering, response
+and logging overheads then delay single events but never add up over the
+run, except the lag of the second offer, which delays the response (and
+the next trial) like a slower answer would. Schedule.onset presents an
+event at its deadline and logs its intended and actual onset; save writes
+that log (trial, event, intended, actual, error in ms) and summary gives
+the mean and largest error.
+
+Waiting uses the coarse wait function until spin ms before the deadline
+and polls the clock for the rest. exp.clock.wait only handles expyriment's
+escape key with process_control_events=True, so the tasks pass it that way.
+
+@author: christianrodriguez
+"""
+
+class Schedule(object):
+    '''
+    Absolute deadlines in ms from t0 (seconds on the clock of now) and the
+    log of intended vs actual onsets.
+    '''
+
+    def __init__(self, t0, now=None, wait=None, spin=2):
+
+        import time
+
+        self.t0 = t0
+        self.now = time.time if now is None else now
+        self.wait = (lambda ms: time.sleep(ms/1000.)) if wait is None else wait
+        self.spin = spin
+        self.log = []
+
+    def time(self):
+        '''
+        ms since t0.
+        '''
+
+        return 1000*(self.now() - self.t0)
+
+    def left(self, target):
+        '''
+        ms left until target (0 if it passed), e.g. for response windows.
+        '''
+
+        return max(target - self.time(), 0)
+
+    def until(self, target):
+        '''
+        Waits until target (ms from t0).
+        '''
+
+        while True:
+            left = target - self.time()
+            if left <= 0:
+                return
+            if left > self.spin:
+                self.wait(left - self.spin)
+
+    def onset(self, event, target, present=None, trial=None):
+        '''
+        Waits until target, calls present (if given) and logs the intended
+        and actual onset. Returns the actual onset (ms from t0).
+        '''
+
+        self.until(target)
+        if present is not None:
+            present()
+        actual = self.time()
+        self.log.append((trial, event, target, actual))
+        return actual
+
+    def summary(self):
+        '''
+        Number of events and mean and largest absolute onset error (ms).
+        '''
+
+        errors = [abs(entry[3] - entry[2]) for entry in self.log]
+        if not errors:
+            return 0, 0., 0.
+        return len(errors), sum(errors)/len(errors), max(errors)
+
+    def save(self, fname):
+        '''
+        Writes the onset log as CSV.
+        '''
+
+        import os
+
+        dirname = os.path.dirname(fname)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        f = open(fname, 'w')
+        f.write('trial,event,intended,actual,error\n')
+        for trial, event, target, actual in self.log:
+            f.write('%s,%s,%.3f,%.3f,%.3f\n' % ('' if trial is None else trial,
+                    event, target, actual, actual - target))
+        f.close()
+
+def wmitctrial(start, fixcprest, foprest, dprest, maxdt):
+    '''
+    Deadlines (ms) of a WMITC trial starting at start: the onsets of the
+    fixation cross, first offer, delay and second offer and the end of the
+    decision window (the latest the ITI can start).
+    '''
+
+    first = start + fixcprest
+    delay = first + foprest
+    second = delay + dprest
+    return start, first, delay, second, second + maxdt
+
+def nbackschedule(ntrials, ibis, inst, stimt, iti, start=0):
+    '''
+    Onsets (ms) of the n-back blocks with ntrials[b] letters each and rests
+    of ibis[b] ms after every block but the last. Returns the block onsets
+    (the rule screen), the letter onsets of every block and the rest onsets.
+    '''
+
+    import numpy as np
+
+    blocks, letters, rests = [], [], []
+    t = start
+    for b, n in enumerate(ntrials):
+        blocks.append(t)
+        letters.append(t + inst + (stimt + iti)*np.arange(n))
+        t = t + inst + (stimt + iti)*n
+        rests.append(t)
+        if b < len(ntrials) - 1:
+            t = t + ibis[b]
+    return np.array(blocks), letters, np.array(rests)
+
+def selftest(ntrials=40, overhead=(2, 12), seed=0):
+    '''
+    Simulates a WMITC run on a virtual clock where every screen takes a
+    random overhead (ms) to present and the subject answers a random time
+    after the second offer (or not at all), and prints how late the second
+    offer of the last trial is, compared with a run without overheads, with
+    chained waits (the old scripts) and with deadlines.
+    '''
+
+    import numpy as np
+
+    durs = (500, 1500, 6000)
+    maxdt = 5000
+    rng = np.random.RandomState(seed)
+    itis = rng.randint(2000, 3001, ntrials)
+    rts = rng.uniform(500, 6000, ntrials) # answers after maxdt are missed
+    cost = rng.uniform(overhead[0], overhead[1], (ntrials, 5))
+
+    # without overheads
+    t = 0.
+    for trial in range(ntrials):
+        ideal = t + sum(durs)
+        t = ideal + min(rts[trial], maxdt) + itis[trial]
+
+    # chained waits: every overhead delays everything after it
+    t = 0.
+    for trial in range(ntrials):
+        for j, dur in enumerate(durs):
+            t = t + cost[trial, j] + dur
+        chained = t + cost[trial, 3] - ideal
+        t = t + cost[trial, 3] + min(rts[trial], maxdt)
+        t = t + cost[trial, 4] + itis[trial]
+
+    # deadlines, the next trial starting an ITI after the response
+    clock = [0.]
+    def wait(ms):
+        clock[0] = clock[0] + ms
+    sched = Schedule(0, now=lambda: clock[0]/1000., wait=wait, spin=0)
+    start = 0.
+    for trial in range(ntrials):
+        onsets = wmitctrial(start, durs[0], durs[1], durs[2], maxdt)
+        for j, event in enumerate(('fix', 'first', 'delay', 'second')):
+            actual = sched.onset(event, onsets[j], lambda: wait(cost[trial, j]),
+                                 trial=trial)
+        # the answer comes rts after the second offer appeared
+        left = sched.left(onsets[4])
+        wait(min(rts[trial], left))
+        resp = onsets[4] if rts[trial] >= left else actual + rts[trial]
+        sched.onset('iti', resp, lambda: wait(cost[trial, 4]), trial=trial)
+        start = resp + itis[trial]
+    deadline = actual - ideal
+
+    n, mean, largest = sched.summary()
+    print('second offer of trial %d, chained waits: %.1f ms late' %
+          (ntrials, chained))
+    print('second offer of trial %d, deadlines: %.1f ms late' %
+          (ntrials, deadline))
+    print('deadlines: %d events, mean error %.1f ms, largest %.1f ms' %
+          (n, mean, largest))
+
+if __name__ == '__main__':
+
+    selftest()
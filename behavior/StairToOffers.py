@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: k, m, LL, offers = stairtooffers(trials, subn, datadir)
+
+Runs the steps between the staircase and the WMITC task in one go: the
+staircase trials [ssamnt ssdel llamnt lldel choice] (the columns FitK
+expects) are fitted with FitK (polishing the best cells of a likelihood
+grid), the offers are made with Gen_WMITC_offers.genoffers and only the final
+files are written:
+  <datadir>/fitted/<subn>_fitkparams.txt   same format as runFitK.py
+  <datadir>/offers/<subn>_offers.txt       read by WMITC.py
+
+stairK.py calls this at the end of the session, so the offers are ready
+right after the last staircase trial. runFitK.py and Gen_WMITC_offers.py
+still work on their own for refitting old sessions.
+
+@author: christianrodriguez
+"""
+
+def stairtooffers(trials, subn, datadir='data', **fitopts):
+    '''
+    Fits the staircase trials of subject subn, writes the fitted parameters
+    and the offers for the WMITC task to datadir and returns (k, m, LL,
+    offers). fitopts are passed to KFitter.fit (init='grid' by default).
+    '''
+
+    import os, numpy
+    from FitK import KFitter
+    from Gen_WMITC_offers import genoffers, writeoffers
+
+    # fill in with a leading zero for file names
+    subns = str(subn).zfill(2)
+
+    # fit the choices
+    fitopts.setdefault('init', 'grid')
+    k, m, ll = KFitter(numpy.asarray(trials, dtype=float)).fit(**fitopts)[:3]
+
+    # write the parameters, like runFitK does
+    if not os.path.isdir('%s/fitted' % (datadir)):
+        os.makedirs('%s/fitted' % (datadir))
+    f = open('%s/fitted/%s_fitkparams.txt' % (datadir, subns), 'w')
+    f.write('"k","m","ll"\n')
+    f.write('%f, %f, %f\n' % (k, m, ll))
+    f.close()
+
+    # make the offers and store in file for experiment
+    offers = genoffers(k, m)
+    writeoffers(offers, subns, '%s/offers' % (datadir))
+
+    return k, m, ll, offers
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: trials = trialarray(datadir)
+       sub = trials.subject(6001, 'WMITC')     # zero-copy view
+       k, m, LL, res = fitk(trials.fitdata(6001, 'WMITC'))
+
+All staircase and WMITC trials in one memory-mapped structured array,
+  <datadir>/store/trials.npy
+with narrow fields (FIELDS): the subject number, the task (position in
+TASKS), session and trial numbers, the two offers in FitK order (r1, d1 is
+the sooner offer, so choice=1 is a choice of the later one), the choice
+(-1 where there was no response), RT and whether the r2 offer was shown
+first. Rows are sorted by subject, task and session, and the offset table
+  <datadir>/store/trials_index.npz
+gives the rows (start, stop) of every subject and of every task within a
+subject, so the trials of any subject are a slice of the mapped file and
+nothing is read or copied until it is used.
+
+The array is rebuilt from the trial stores (see TrialStore) whenever they
+change.
+
+@author: christianrodriguez
+"""
+
+TASKS = ('stairK', 'WMITC')
+
+FIELDS = [('subject', 'u2'), ('task', 'u1'), ('session', 'u1'),
+          ('trial', 'u2'), ('r1', 'f4'), ('d1', 'u2'), ('r2', 'f4'),
+          ('d2', 'u2'), ('choice', 'i1'), ('rt', 'f4'), ('first', 'u1')]
+
+# columns of the trial store of every task for the offers (presentation
+# order), trial number, choice and RT
+COLUMNS = {'stairK': ('ssamnt', 'ssdel', 'llamnt', 'lldel', 'trial', 'choice', 'RT'),
+           'WMITC':  ('famnt', 'fdel', 'pamnt', 'pdel', 'trial', 'choice', 'RT')}
+
+class TrialArray(object):
+    '''
+    Memory-mapped trials of all tasks and their offset table. trials is the
+    structured array, subjects the subject numbers and start, stop the rows
+    of every subject; tstart and tstop have one column per task.
+    '''
+
+    def __init__(self, fname):
+
+        import numpy
+
+        self.fname = fname
+        self.trials = numpy.load(fname, mmap_mode='r')
+        with numpy.load(fname[:-4] + '_index.npz') as f:
+            for key in ('subjects', 'start', 'stop', 'tstart', 'tstop'):
+                setattr(self, key, f[key])
+
+    def __len__(self):
+        return len(self.trials)
+
+    def subject(self, subject, task=None):
+        '''
+        View of the trials of subject, of one task (name or number) if
+        given.
+        '''
+
+        import numpy
+
+        i = numpy.searchsorted(self.subjects, subject)
+        if i == len(self.subjects) or self.subjects[i] != subject:
+            return self.trials[:0]
+        if task is None:
+            return self.trials[self.start[i]:self.stop[i]]
+        if not isinstance(task, int):
+            task = TASKS.index(task)
+        return self.trials[self.tstart[i, task]:self.tstop[i, task]]
+
+    def fitdata(self, subject, task=None, session=None):
+        '''
+        Trials of subject (of one session if given) as the [r1 d1 r2 d2
+        choice] matrix used by FitK, with amounts rounded back to cents and
+        nan for missing choices.
+        '''
+
+        import numpy
+
+        sub = self.subject(subject, task)
+        if session is not None:
+            sub = sub[sub['session'] == session]
+        data = numpy.column_stack([sub[c].astype(float) for c in
+                                   ('r1', 'd1', 'r2', 'd2', 'choice')])
+        data[:,[0,2]] = numpy.round(data[:,[0,2]], 2)
+        data[sub['choice'] < 0, 4] = numpy.nan
+        return data
+
+def consolidate(datadir, stores=None):
+    '''
+    Writes the consolidated array and offset table of the trial stores
+    (by default those of all TASKS in datadir) and returns its TrialArray.
+    '''
+
+    import numpy
+    from TrialStore import trialstore
+    from atomicwrite import atomicwrite
+
+    if stores is None:
+        stores = [trialstore(datadir, task) for task in TASKS]
+    n = sum(len(store) for store in stores)
+    dtype = numpy.dtype(FIELDS)
+
+    # gather all tasks in memory first, this is what gets sorted
+    cols = dict((name, numpy.empty(n, dtype=dt)) for name, dt in FIELDS)
+    row = 0
+    for task, store in enumerate(stores):
+        if not len(store):
+            continue
+        sel = slice(row, row + len(store))
+        fa, fd, pa, pd, trial, choice, rt = \
+            [store.columns[c] for c in COLUMNS[TASKS[task]]]
+
+        # the sooner offer goes first, like FitK expects
+        swap = fd > pd
+        cols['r1'][sel] = numpy.where(swap, pa, fa)
+        cols['d1'][sel] = numpy.where(swap, pd, fd)
+        cols['r2'][sel] = numpy.where(swap, fa, pa)
+        cols['d2'][sel] = numpy.where(swap, fd, pd)
+        cols['first'][sel] = swap
+        cols['choice'][sel] = numpy.where(numpy.isnan(choice), -1, choice)
+        cols['rt'][sel] = rt
+        cols['trial'][sel] = trial
+        cols['subject'][sel] = store.columns['subject_id']
+        cols['session'][sel] = numpy.repeat(store.session, store.stop - store.start)
+        cols['task'][sel] = task
+        row = row + len(store)
+
+    # sort by subject, task and session (keeping the trial order)
+    order = numpy.lexsort((numpy.arange(n), cols['session'], cols['task'],
+                           cols['subject']))
+
+    # offset table of subjects and of the tasks of every subject
+    subj = cols['subject'][order]
+    task = cols['task'][order]
+    subjects, start = numpy.unique(subj, return_index=True)
+    stop = numpy.append(start[1:], n)
+    keys = subj.astype(int)*len(TASKS) + task
+    wanted = subjects.astype(int)[:,None]*len(TASKS) + numpy.arange(len(TASKS))
+    tstart = numpy.searchsorted(keys, wanted)
+    tstop = numpy.searchsorted(keys, wanted, side='right')
+
+    # write the array straight into the mapped file, the index is in place
+    # before the array (whose mtime trialarray checks) is
+    fname = '%s/store/trials.npy' % (datadir)
+    with atomicwrite(fname) as tmp:
+        out = numpy.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, 
+                                           shape=(n,))
+        for name, dt in FIELDS:
+            out[name] = cols[name][order]
+        out.flush()
+        del out
+        with atomicwrite(fname[:-4] + '_index.npz') as itmp:
+            numpy.savez(itmp, subjects=subjects, start=start, stop=stop,
+                        tstart=tstart, tstop=tstop)
+    return TrialArray(fname)
+
+def trialarray(datadir):
+    '''
+    Consolidated trials of datadir, rebuilt first if any trial store
+    changed since they were last consolidated.
+    '''
+
+    import os
+    from TrialStore import trialstore
+
+    fname = '%s/store/trials.npy' % (datadir)
+    stores = [trialstore(datadir, task) for task in TASKS]
+    try:
+        built = os.stat(fname).st_mtime
+    except OSError:
+        built = None
+    if built is None or any(os.path.exists(s.fname) and
+                            os.stat(s.fname).st_mtime > built for s in stores):
+        return consolidate(datadir, stores)
+    return TrialArray(fname)
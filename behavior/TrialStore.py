@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: store = trialstore(datadir, 'WMITC')
+       trials = store.trials(6001, columns=['famnt', 'fdel', 'pamnt', 'pdel'])
+
+Columnar store of the trials recorded by expyriment. The .xpd files of a task
+(e.g. WMITC_*.xpd or stairK_*.xpd in datadir) are parsed once and kept in
+  <datadir>/store/<task>_trials.npz
+with one array per data column, rows sorted by subject and session, and an
+index giving the rows (start, stop) of every session. Sessions are the files
+of a subject in file name (i.e. date) order, numbered from 1. trialstore
+ingests new or changed files incrementally: files already in the store (same
+name, size and modification time) are not parsed again.
+
+@author: christianrodriguez
+"""
+
+class TrialStore(object):
+    '''
+    Trials of one task. names are the data columns (in file order), columns
+    holds one array per name and the session index is kept in subject,
+    session, start, stop and source (one entry per session).
+    '''
+
+    def __init__(self, fname):
+
+        import numpy
+
+        self.fname = fname
+        self.names = []
+        self.columns = {}
+        self.subject = numpy.zeros(0)
+        self.session = numpy.zeros(0, dtype=int)
+        self.start = numpy.zeros(0, dtype=int)
+        self.stop = numpy.zeros(0, dtype=int)
+        self.source = numpy.zeros(0, dtype=str)
+        self.size = numpy.zeros(0, dtype=int)
+        self.mtime = numpy.zeros(0)
+
+        try:
+            f = numpy.load(fname)
+        except (IOError, OSError):
+            return
+        with f:
+            self.names = list(f['names'])
+            self.columns = dict((n, f['col_' + n]) for n in self.names)
+            for key in ('subject', 'session', 'start', 'stop', 'source',
+                        'size', 'mtime'):
+                setattr(self, key, f[key])
+
+    def subjects(self):
+        '''
+        Subject numbers in the store.
+        '''
+
+        import numpy
+
+        return numpy.unique(self.subject)
+
+    def sessions(self, subject):
+        '''
+        Session numbers of subject.
+        '''
+
+        return self.session[self.subject == subject]
+
+    def rows(self, subject=None, session=None):
+        '''
+        Slice of the rows of subject (all subjects if None) and, optionally,
+        one of its sessions.
+        '''
+
+        import numpy
+
+        if subject is None:
+            return slice(0, len(self))
+        pick = self.subject == subject
+        if session is not None:
+            pick = pick & (self.session == session)
+        pick = numpy.flatnonzero(pick)
+        if not pick.size:
+            return slice(0, 0)
+        return slice(self.start[pick[0]], self.stop[pick[-1]])
+
+    def trials(self, subject=None, session=None, columns=None):
+        '''
+        (n_trials, n_columns) array of the trials of subject (all if None)
+        and, optionally, one session, with the given columns (all names by
+        default) in the given order.
+        '''
+
+        import numpy
+
+        if columns is None:
+            columns = self.names
+        sel = self.rows(subject, session)
+        out = numpy.empty((sel.stop - sel.start, len(columns)))
+        for j, name in enumerate(columns):
+            out[:,j] = self.columns[name][sel]
+        return out
+
+    def __len__(self):
+        return int(self.stop[-1]) if len(self.stop) else 0
+
+    def ingest(self, files):
+        '''
+        Adds the .xpd files that are new or changed since they were stored,
+        drops the trials of files that are gone and saves the store. Returns
+        the number of files parsed.
+        '''
+
+        import os, numpy
+
+        stat = dict((os.path.basename(f), (f, os.stat(f))) for f in files)
+        known = dict((s, (z, t)) for s, z, t in
+                     zip(self.source, self.size, self.mtime))
+        todo = [name for name, (f, st) in stat.items()
+                if known.get(name) != (st.st_size, st.st_mtime)]
+        gone = [name for name in known if name not in stat]
+        if not todo and not gone:
+            return 0
+
+        # rows of the unchanged files, per file
+        parts = {}
+        for i, name in enumerate(self.source):
+            if name in stat and name not in todo:
+                sel = slice(self.start[i], self.stop[i])
+                parts[name] = (self.subject[i], self.size[i], self.mtime[i],
+                               dict((n, self.columns[n][sel]) for n in self.names))
+
+        # parse the new ones (empty files are kept so they are not reparsed)
+        for name in todo:
+            f, st = stat[name]
+            names, data = readxpd(f)
+            if not len(data):
+                parts[name] = (_filesubject(name), st.st_size, st.st_mtime, {})
+                continue
+            if not self.names:
+                self.names = names
+            elif names != self.names:
+                raise ValueError('%s has columns %s, not %s' %
+                                 (f, names, self.names))
+            parts[name] = (data[0, names.index('subject_id')], st.st_size,
+                           st.st_mtime,
+                           dict((n, data[:,j]) for j, n in enumerate(names)))
+
+        # sort by subject, then file name, and rebuild the index
+        order = sorted(parts, key=lambda name: (parts[name][0], name))
+        empty = numpy.zeros(0)
+        lens = numpy.array([len(parts[name][3].get(self.names[0], empty))
+                            if self.names else 0 for name in order], dtype=int)
+        self.subject = numpy.array([parts[name][0] for name in order], dtype=float)
+        self.session = numpy.ones(len(order), dtype=int)
+        for i in range(1, len(order)):
+            if self.subject[i] == self.subject[i-1]:
+                self.session[i] = self.session[i-1] + 1
+        self.stop = numpy.cumsum(lens)
+        self.start = self.stop - lens
+        self.source = numpy.array(order, dtype=str)
+        self.size = numpy.array([parts[name][1] for name in order], dtype=int)
+        self.mtime = numpy.array([parts[name][2] for name in order], dtype=float)
+        self.columns = dict((n, numpy.concatenate([empty] +
+                                [parts[name][3].get(n, empty) for name in order]))
+                            for n in self.names)
+        self.save()
+        return len(todo)
+
+    def save(self):
+        '''
+        Writes the store (atomically, so readers never see half a store).
+        '''
+
+        import numpy
+        from atomicwrite import atomicwrite
+
+        cols = dict(('col_' + n, self.columns[n]) for n in self.names)
+        with atomicwrite(self.fname) as tmp:
+            numpy.savez_compressed(tmp, names=numpy.array(self.names, dtype=str),
+                                   subject=self.subject, session=self.session,
+                                   start=self.start, stop=self.stop,
+                                   source=self.source, size=self.size,
+                                   mtime=self.mtime, **cols)
+
+def readxpd(fname):
+    '''
+    Reads an expyriment data file. Returns the column names and an
+    (n_trials, n_columns) float array (nan where a value is not a number).
+    '''
+
+    import numpy
+
+    f = open(fname)
+    lines = [line for line in f if line.strip() and not line.startswith('#')]
+    f.close()
+    if not lines:
+        return [], numpy.zeros((0, 0))
+    names = [n.strip() for n in lines[0].strip().split(',')]
+    if len(lines) == 1:
+        return names, numpy.zeros((0, len(names)))
+    data = numpy.genfromtxt(lines[1:], delimiter=',', dtype=float)
+    return names, data.reshape(-1, len(names))
+
+def _filesubject(name):
+    '''
+    Subject number in an expyriment file name (<task>_<subject>_<date>.xpd),
+    used for files without trials.
+    '''
+
+    try:
+        return float(name.split('_')[1])
+    except (IndexError, ValueError):
+        return float('inf')
+
+def trialstore(datadir, task):
+    '''
+    Store of the trials of task (the .xpd files named <task>_*.xpd in
+    datadir), updated with any new or changed files.
+    '''
+
+    from glob import glob
+
+    store = TrialStore('%s/store/%s_trials.npz' % (datadir, task))
+    store.ingest(glob('%s/%s_*.xpd' % (datadir, task)))
+    return store
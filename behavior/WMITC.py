@@ -8,8 +8,13 @@ offer generator script, 'Gen_WMITC_offers.py'. The experiment is divided into
 four runs where a quarter of the offers are presented. Each trial presents a 
 fixation cross for .5s, then a fixed offer for 1.5s. The first offer could be 
 an SS or LL. Then a fixation cross is presented for 6 seconds before the 
-probability adjusted offer is presented for a maximum of 4 seconds. The ITI 
-goes from 2-3 seconds, with uniform jitter.
+probability adjusted offer is presented for a maximum of 5 seconds. The ITI 
+starts at the response and goes from 2-3 seconds, with uniform jitter. All
+offer screens of the run are rendered and preloaded before the scanner is
+triggered (see wmitcstim.py). The screens of every trial wait for deadlines
+set from the start of the trial, and the ITI and the next trial from the
+response (see Schedule.py), so timing overheads do not add up over the run.
+Intended and actual onsets are saved to data/onsets.
  
 Check out:
 http://en.wikipedia.org/wiki/Hyperbolic_discounting
@@ -36,6 +41,8 @@ secs = 10             # seconds to wait if warining screen is ran
 from expyriment import design, control, stimuli, misc
 import os, serial
 import numpy as np
+from wmitcstim import blockoffers, prepareoffers
+from Schedule import Schedule, wmitctrial
 
 # make sure the script runs on the appropriate directory
 maindir = '/Users/christianrodriguez/Dropbox/Python'
@@ -74,17 +81,20 @@ except IOError:
     % (subj))
   
 # select the stimuli to be presented
-if blck == 1:
-    offers = offers[:40,:]
-elif blck == 2: 
-    offers = offers[40:80,:]
-elif blck == 3: 
-    offers = offers[80:120,:]
-elif blck == 4: 
-    offers = offers[120:,:]
-else:
+try:
+    offers = blockoffers(offers, blck)
+except ValueError as err:
     control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
-    print('The run number should be between 1 and 4.')
+    print(err)
+
+# render and preload all offer screens of this run (and the ITI screen) now,
+# so no text is rendered inside the timed part of the trials
+screens = prepareoffers(offers, tsize, amtpos, delpos)
+blank = stimuli.BlankScreen()
+blank.preload()
+
+# draw the inter-trial intervals of the run
+itis = np.random.randint(itir[0],itir[1],len(offers))
   
 # present instruction screen
 instrcs = []
@@ -129,70 +139,51 @@ ser.close() # close port
 # start clock and get the a relative t = 0 mark
 clock = misc.Clock()
 strtt = clock.monotonic_time()
+
+# onsets are deadlines in ms from strtt, waits process the escape key
+sched = Schedule(strtt, now=clock.monotonic_time,
+                 wait=lambda ms: exp.clock.wait(ms, process_control_events=True))
           
 # wait for several seconds to allow for signal saturation
-while secs > 0:
-    intro = 'The task will start in %d seconds' % secs
-    stimuli.TextScreen('', intro, text_size= instsize, 
-                       text_colour= white).present()
-    exp.clock.wait(1000)
-    secs = secs - 1
-
-# loop for specified number of trials
+for sec in range(secs):
+    intro = 'The task will start in %d seconds' % (secs - sec)
+    intro = stimuli.TextScreen('', intro, text_size= instsize, 
+                               text_colour= white)
+    intro.preload()
+    sched.onset('countdown', 1000*sec, intro.present)
+
+# loop for specified number of trials, the first starts after the countdown
 trial = 0
+start = 1000*secs
 while trial < len(offers):
     
-    # present fixation cross and wait sometime
-    fixcross.present()
-    exp.clock.wait(fixcprest)
+    # present fixation cross until the first offer
+    fixofs, fofs, dofs, pofs, endofs = wmitctrial(start, fixcprest, foprest,
+                                                  dprest, maxdt)
+    sched.onset('fix', fixofs, fixcross.present, trial)
     
     
-    # get the fixed offer, present and wait for sometime
+    # get the fixed offer, present it until the delay, when it appears (s)
     foffer = offers[trial,:2]
-    famnt = '$'+'%.2f' % (np.round(foffer[0], decimals = 1))
-    if foffer[1] == 0:
-        fdel = 'Today'
-    else:
-        fdel = '%.0f' % (foffer[1])+' days'
-        
-    screen = stimuli.BlankScreen()
-    stim1 = stimuli.TextLine(text=famnt, position=amtpos, 
-                             text_colour=(255,255,0), text_size = tsize)
-    stim2 = stimuli.TextLine(text=fdel, position=delpos, 
-                             text_colour=(255,255,0), text_size = tsize)
-    stim1.plot(screen)
-    stim2.plot(screen)
-    screen.present()
-    foffert = clock.monotonic_time() - strtt # when the first offer appears
-    exp.clock.wait(foprest)
+    fscreen, pscreen = screens[trial]
+    foffert = sched.onset('first', fofs, fscreen.present, trial)/1000.
     
-    # present fixation cross and wait sometime
-    fixcross.present()
-    dtime = clock.monotonic_time() - strtt # when the fix-cross appears
-    exp.clock.wait(dprest)
+    # present fixation cross until the second offer, when it appears (s)
+    dtime = sched.onset('delay', dofs, fixcross.present, trial)/1000.
     
-    # get probability adjusted offer, present and wait (some max  time) for resp
+    # get probability adjusted offer, present and wait (some max time) for 
+    # resp, when it appears (s); wait_char starts right after the screen is
+    # presented, so rt (also in the data file) is from the actual onset
     poffer = offers[trial,2:]
-    pamnt = '$'+'%.2f' % (np.round(poffer[0], decimals = 1))
-    if poffer[1] == 0:
-        pdel = 'Today'
-    else:
-        pdel = '%.0f' % (poffer[1])+' days'
+    poffert = sched.onset('second', pofs, pscreen.present, trial)/1000.
+    button, rt = response_device.wait_char([fbutton,sbutton], 
+                                           duration=sched.left(endofs))
     
-    screen = stimuli.BlankScreen()    
-    stim3 = stimuli.TextLine(text=pamnt, position=amtpos,
-                            text_colour=(0,255,0), text_size = tsize)
-    stim4 = stimuli.TextLine(text=pdel, position=delpos,
-                            text_colour=(0,255,0), text_size = tsize)
-    stim3.plot(screen)
-    stim4.plot(screen)
-    screen.present()
-    poffert = clock.monotonic_time() - strtt # when the second offer appears
-    button, rt = response_device.wait_char([fbutton,sbutton], duration=maxdt)
-    
-    # present random ITI screen
-    screen = stimuli.BlankScreen().present()
-    exp.clock.wait(np.random.randint(itir[0],itir[1]))
+    # present ITI screen at the response (rt after the second offer appeared)
+    # or at the end of the decision window, the next trial starts an ITI later
+    itiofs = endofs if button is None else poffert*1000 + rt
+    sched.onset('iti', itiofs, blank.present, trial)
+    start = itiofs + itis[trial]
             
     # code choices
     if button is None:
@@ -211,5 +202,9 @@ while trial < len(offers):
     # move onto next trial              
     trial = trial + 1
 
+# wait for the last ITI and save the onsets
+sched.until(start)
+sched.save('%s/data/onsets/WMITC_%s_run%d_onsets.csv' % (maindir, subj, blck))
+
 # End Experiment
 control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
\ No newline at end of file
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 """
-This script opens subject files and searches for a random trial to determine 
-payment. It is set-up to ignore empty non-collected blocks and non-response 
-trials.
+This script picks a random trial of a subject (from the trial store, see
+TrialStore) to determine payment. It is set-up to ignore empty non-collected
+blocks and non-response trials.
+
+Usage: python WMITClottery.py
+   or: printlottery(*lottery(6001, resultsdir))
 
 Created on Tue Oct 28 16:33:14 2014
 
@@ -12,51 +15,76 @@ Created on Tue Oct 28 16:33:14 2014
 # Set-up the directory
 #resultsdir = '/Users/christianrodriguez/Dropbox/Python/data'
 resultsdir = '/Users/Marjolein/Dropbox/Python/data'
-# Get the subject number
-subject_code = input('Enter subject number: ')
-
-# import useful modules
-import random, os, numpy, datetime
-from glob import glob
-
-# look for available files for this subject
-os.chdir(resultsdir)
-subj_files = glob('WMITC_%d_*' % subject_code)
-
-# load file get a random trial
-valid = False
-while not valid:
-    
-    # randomly pick one file and load contents
-    randfile = random.randint(0,len(subj_files)-1)
-    data = numpy.genfromtxt('%s' % subj_files[randfile], delimiter=',', skip_header=1)
-    
-    # pick a random trial if there are any in file
-    if len(data.shape) > 1: # skip file if empty or contains only one trial
-        trial = random.randint(0,len(data)-1)
-        
-        # get trial details
-        details=data[trial,]
-        if not numpy.isnan(details[7]):
-            valid = True
-
-# print lottery outcome
-print('\n\nBlock %d, trial %d' % (randfile+1, trial+1))
-
-# Get today's date
-date = datetime.date.today()
-datenum = datetime.date.today().toordinal()
-
-# Write text to screen
-print('Your choices were $%.2f in %.0f days or $%.2f in %.0f days' % 
-        (round(details[3],1), details[4], round(details[5],1), details[6]))
-if details[7]:
-    outcome = (round(details[5],1),details[6])
-elif not details[7]:
-    outcome = (round(details[3],1),details[4])    
-print('You chose $%.2f in %.0f days' % (outcome[0],outcome[1]))
-#print('Today is %s' % date.strftime("%B %d, %Y"));
-paydate = date.fromordinal(int(datenum + outcome[1]))
-print('That means your payment will be $%.2f on %s\n\n' % (outcome[0], paydate.strftime("%B %d, %Y")))
 
+def lottery(subject_code, resultsdir=resultsdir, rng=None):
+    '''
+    Picks a random answered trial of subject_code. Returns the block and
+    trial numbers (from 1) and the trial details (a row of the WMITC data).
+    '''
+
+    # import useful modules
+    import random, numpy
+    from TrialStore import trialstore
+
+    if rng is None:
+        rng = random
+
+    # look for available sessions for this subject (new files are ingested first)
+    subject_code = int(subject_code)
+    store = trialstore(resultsdir, 'WMITC')
+    sessions = store.sessions(subject_code)
+    if not any(numpy.any(~numpy.isnan(store.trials(subject_code, s)[:,7]))
+               for s in sessions):
+        raise ValueError('subject %d has no answered trials' % subject_code)
+
+    # load session get a random trial
+    valid = False
+    while not valid:
+
+        # randomly pick one session and load contents
+        randfile = rng.randint(0,len(sessions)-1)
+        data = store.trials(subject_code, sessions[randfile])
+
+        # pick a random trial if there are any in session
+        if len(data) > 1: # skip session if empty or contains only one trial
+            trial = rng.randint(0,len(data)-1)
+
+            # get trial details
+            details=data[trial,]
+            if not numpy.isnan(details[7]):
+                valid = True
+
+    return randfile+1, trial+1, details
+
+def printlottery(block, trial, details):
+    '''
+    Prints the lottery outcome and the payment date.
+    '''
+
+    import datetime
+
+    # print lottery outcome
+    print('\n\nBlock %d, trial %d' % (block, trial))
+
+    # Get today's date
+    date = datetime.date.today()
+    datenum = datetime.date.today().toordinal()
+
+    # Write text to screen
+    print('Your choices were $%.2f in %.0f days or $%.2f in %.0f days' %
+            (round(details[3],1), details[4], round(details[5],1), details[6]))
+    if details[7]:
+        outcome = (round(details[5],1),details[6])
+    elif not details[7]:
+        outcome = (round(details[3],1),details[4])
+    print('You chose $%.2f in %.0f days' % (outcome[0],outcome[1]))
+    #print('Today is %s' % date.strftime("%B %d, %Y"));
+    paydate = date.fromordinal(int(datenum + outcome[1]))
+    print('That means your payment will be $%.2f on %s\n\n' % (outcome[0], paydate.strftime("%B %d, %Y")))
+
+if __name__ == '__main__':
+
+    # Get the subject number
+    subject_code = input('Enter subject number: ')
 
+    printlottery(*lottery(subject_code))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: with atomicwrite('/path/to/store.npz') as tmp:
+           numpy.savez(tmp, ...)
+
+Atomic writes for the stores and caches of the behavior tools. The file is
+written under a temporary name in its own directory (so the final rename
+never crosses file systems) and moved over the old file in one step when
+the with block ends, so readers see the old file or the new one and never
+half a file. The temporary name keeps the extension of the file, so writers
+that add one (numpy.save, numpy.savez) use it as given, and starts with a
+dot, so listings of the entries in the directory skip it. If the block
+raises, the temporary file is removed and the old file is kept.
+
+@author: christianrodriguez
+"""
+
+from contextlib import contextmanager
+
+@contextmanager
+def atomicwrite(fname):
+    '''
+    Yields the temporary name to write fname to, and moves it over fname
+    when the with block ends. The directory of fname is made if needed.
+    '''
+
+    import os
+
+    dirname, base = os.path.split(fname)
+    if dirname and not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # made by another process in the meantime
+            if not os.path.isdir(dirname):
+                raise
+    tmp = os.path.join(dirname, '.%s.%d.tmp%s' % (base, os.getpid(),
+                                                  os.path.splitext(base)[1]))
+    try:
+        yield tmp
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    getattr(os, 'replace', os.rename)(tmp, fname)
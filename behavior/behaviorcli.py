@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: python behaviorcli.py fit 6001 [--plot]
+       python behaviorcli.py generate-offers 6001 6002
+       python behaviorcli.py lottery 6001 [--seed 1]
+       python behaviorcli.py analyze [--outdir DIR] [--nworkers N]
+       python behaviorcli.py report [--task WMITC] [--outdir DIR] [--nworkers N]
+       python behaviorcli.py startup [--repeat 5]
+All commands take --datadir (the expyriment data directory).
+
+One command line for the behavior tools. Only argparse is loaded at start-up:
+every subcommand imports its module (runFitK, Gen_WMITC_offers, WMITClottery,
+wmitcanalysis or behaviorreport) when it runs, and those import numpy,
+pandas, statsmodels or matplotlib inside the functions that use them, so
+drawing the lottery or fitting one subject headless never pays for the
+analysis and plotting libraries.
+
+startup is the cold-start benchmark: every command is started REPEAT times
+in a fresh interpreter, importing what the command needs (NEEDS) but doing
+no work, and the best and median wall times are printed next to those of a
+bare interpreter and of the command line itself. It also lists any of the
+HEAVY modules loaded at start-up, which should be none.
+
+@author: christianrodriguez
+"""
+
+datadir = '/Users/christianrodriguez/Dropbox/Python/data'
+
+# libraries that are slow to import, never loaded at start-up
+HEAVY = ('numpy', 'scipy', 'pandas', 'matplotlib', 'seaborn', 'statsmodels')
+
+# command -> (module, function) that does the work
+COMMANDS = {'fit':             ('runFitK', 'fitsubject'),
+            'generate-offers': ('Gen_WMITC_offers', 'cohortoffers'),
+            'lottery':         ('WMITClottery', 'lottery'),
+            'analyze':         ('wmitcanalysis', 'analyze'),
+            'report':          ('behaviorreport', 'report')}
+
+# libraries imported by the work of every command (timed by startup)
+NEEDS = {'fit':             ('numpy',),
+         'fit --plot':      ('numpy', 'matplotlib.pyplot'),
+         'generate-offers': ('numpy',),
+         'lottery':         ('numpy',),
+         'analyze':         ('numpy', 'pandas', 'statsmodels.formula.api'),
+         'report':          ('numpy', 'pandas', 'matplotlib.pyplot')}
+
+def command(name):
+    '''
+    Imports the module of a command and returns its function.
+    '''
+
+    import importlib
+
+    module, func = COMMANDS[name]
+    return getattr(importlib.import_module(module), func)
+
+def fit(args):
+
+    func = command('fit')
+    for subn in args.subjects:
+        func(subn, args.datadir, plot=args.plot)
+    if args.plot:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+def generateoffers(args):
+
+    command('generate-offers')(args.subjects,
+                               paramsdir='%s/fitted' % (args.datadir),
+                               offersdir='%s/offers' % (args.datadir))
+
+def lottery(args):
+
+    import random
+    from WMITClottery import printlottery
+
+    rng = random.Random(args.seed)
+    printlottery(*command('lottery')(args.subject, args.datadir, rng=rng))
+
+def analyze(args):
+
+    results = command('analyze')(args.datadir, args.outdir, args.nworkers)
+    for name in sorted(results):
+        print('%s\n%s\n' % (name, results[name][1]))
+
+def report(args):
+
+    print(command('report')(args.datadir, args.outdir, task=args.task,
+                            nworkers=args.nworkers))
+
+def startup(args):
+
+    import os, subprocess, sys, time
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = ('import sys; sys.path.insert(0, %r); import behaviorcli; '
+             'behaviorcli.parser()' % here)
+    cases = [('python', 'pass'), ('behaviorcli', check)]
+    for name in sorted(NEEDS):
+        cmd = name.split()[0]
+        cases.append((name, '%s; behaviorcli.command(%r); import %s' %
+                      (check, cmd, ', '.join(NEEDS[name]))))
+
+    print('%-16s %9s %9s' % ('command', 'best ms', 'median ms'))
+    for name, code in cases:
+        times = []
+        for _ in range(args.repeat):
+            start = time.time()
+            subprocess.check_call([sys.executable, '-c', code], cwd=here)
+            times.append(1000*(time.time() - start))
+        times.sort()
+        print('%-16s %9.1f %9.1f' % (name, times[0], times[len(times)//2]))
+
+    # heavy modules loaded by the command line itself
+    out = subprocess.check_output([sys.executable, '-c', check +
+        '; print(" ".join(m for m in sys.modules if m.split(".")[0] in %r))'
+        % (HEAVY,)], cwd=here)
+    print('heavy modules at start-up: %s' %
+          (out.decode().strip() or 'none'))
+
+def parser():
+    '''
+    The argument parser of the command line.
+    '''
+
+    import argparse
+
+    p = argparse.ArgumentParser(description='Behavior tools of the WMITC study.')
+    sub = p.add_subparsers(dest='command')
+
+    c = sub.add_parser('fit', help='fit the staircase of subjects')
+    c.add_argument('subjects', nargs='+', type=int)
+    c.add_argument('--plot', action='store_true',
+                   help='show the fit diagnostic plots')
+    c.set_defaults(func=fit)
+
+    c = sub.add_parser('generate-offers', help='write the WMITC offers of '
+                       'subjects from their fitted parameters')
+    c.add_argument('subjects', nargs='+')
+    c.set_defaults(func=generateoffers)
+
+    c = sub.add_parser('lottery', help='draw the paid trial of a subject')
+    c.add_argument('subject', type=int)
+    c.add_argument('--seed', type=int, default=None)
+    c.set_defaults(func=lottery)
+
+    c = sub.add_parser('analyze', help='fit the mixed models of the WMITC data')
+    c.add_argument('--outdir', default=None)
+    c.add_argument('--nworkers', type=int, default=None)
+    c.set_defaults(func=analyze)
+
+    c = sub.add_parser('report', help='draw the fits and group plots into '
+                       'an HTML report')
+    c.add_argument('--task', default='WMITC', choices=('WMITC', 'stairK'))
+    c.add_argument('--outdir', default=None)
+    c.add_argument('--nworkers', type=int, default=None)
+    c.set_defaults(func=report)
+
+    c = sub.add_parser('startup', help='measure the cold-start time of the commands')
+    c.add_argument('--repeat', type=int, default=5)
+    c.set_defaults(func=startup)
+
+    for c in sub.choices.values():
+        c.add_argument('--datadir', default=datadir)
+    return p
+
+def main(argv=None):
+
+    args = parser().parse_args(argv)
+    if getattr(args, 'func', None) is None:
+        parser().print_help()
+        return 2
+    args.func(args)
+    return 0
+
+if __name__ == '__main__':
+
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: python behaviorreport.py [datadir [outdir]]
+   or: report(datadir, outdir, task='WMITC', nworkers=None)
+
+Static report of the fits and group results of a cohort. Every subject's
+trials of task are fitted with grid starts (see FitK.fitcohort, through the
+fit cache): all WMITC runs, or for stairK only the first session, like
+runFitK.py, so the k and m shown are those of <datadir>/fitted. Then
+the FitK diagnostic panels (discount curve, SV by delay, p(ll) vs net value)
+of every subject are drawn with the non-interactive Agg backend, one figure
+per job in a pool of nworkers processes, together with the group plots of
+GROUPPLOTS (means and standard errors over subjects of the WMITC summary
+tables, see wmitcanalysis). Everything goes to outdir
+(<datadir>/report/<task> by default):
+  index.html            the group plots, then one row per subject
+  group_<name>.png      the group plots
+  subject_<n>.png       the diagnostic panels of every subject
+
+@author: christianrodriguez
+"""
+
+# group plots: name -> (summary table, x, y, column to split lines by)
+GROUPPLOTS = {'choice_pll_famnt':   ('p',   'pll',     'choice', 'famnt'),
+              'choice_pll':         ('pb',  'pll',     'choice', None),
+              'choice_ispll_famnt': ('p2',  'ispll',   'choice', 'famnt'),
+              'choice_ispll':       ('p2b', 'ispll',   'choice', None),
+              'rt_pllsqrd':         ('rt',  'pllsqrd', 'RT',     None),
+              'rt_ispllsqrd':       ('rt2', 'pllsqrd', 'RT',     None)}
+
+def report(datadir, outdir=None, task='WMITC', nworkers=None, group=None,
+           seed=0):
+    '''
+    Fits and draws every subject with trials of task in datadir, draws the
+    group plots (if group is True, by default for WMITC only) and writes
+    index.html. Returns the path of index.html.
+    '''
+
+    import os
+    from FitK import fitcohort, poolmap
+    from FitCache import FitCache
+    from TrialArray import trialarray
+    from atomicwrite import atomicwrite
+
+    if group is None:
+        group = task == 'WMITC'
+    if outdir is None:
+        outdir = '%s/report/%s' % (datadir, task)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # fits of every subject with grid starts (unchanged subjects come from
+    # the cache), the staircase from its first session like runFitK does
+    session = 1 if task == 'stairK' else None
+    trials = trialarray(datadir)
+    datasets = [(int(s), trials.fitdata(s, task, session))
+                for s in trials.subjects]
+    subs = [s for s, data in datasets if len(data)]
+    datasets = [data for s, data in datasets if len(data)]
+    fits = fitcohort(datasets, nworkers=nworkers, seed=seed, progress=False,
+                     cache=FitCache('%s/fitted/cache' % (datadir)), init='grid')
+
+    # one figure per job
+    jobs = [('subject', '%s/subject_%d.png' % (outdir, s),
+             ('%d: k = %.5f, m = %.3f, LL = %.2f' % ((s,) + tuple(fit)),
+              fit[:2], data))
+            for s, fit, data in zip(subs, fits, datasets)]
+    if group:
+        from wmitcanalysis import loadtables, modeltables
+        tables = modeltables(loadtables(datadir))
+        for name in sorted(GROUPPLOTS):
+            table, x, y, hue = GROUPPLOTS[name]
+            jobs.append(('group', '%s/group_%s.png' % (outdir, name),
+                         (name, tables[table], x, y, hue)))
+    for fname in poolmap(_drawjob, jobs, nworkers):
+        pass
+
+    # the page
+    html = ['<html><head><title>%s report</title></head><body>' % (task),
+            '<h1>%s: %d subjects</h1>' % (task, len(subs))]
+    if group:
+        html.append('<h2>Group</h2>')
+        html.extend('<img src="group_%s.png">' % (name)
+                    for name in sorted(GROUPPLOTS))
+    html.append('<h2>Subjects</h2>')
+    for kind, fname, args in jobs:
+        if kind == 'subject':
+            html.append('<p>%s<br><img src="%s"></p>' %
+                        (args[0], os.path.basename(fname)))
+    html.append('</body></html>')
+
+    index = '%s/index.html' % (outdir)
+    with atomicwrite(index) as tmp:
+        f = open(tmp, 'w')
+        f.write('\n'.join(html) + '\n')
+        f.close()
+    return index
+
+def groupplot(table, x, y, hue=None):
+    '''
+    Mean and standard error over subjects of y at every value of x (one
+    line per value of hue) in a new figure, which is returned.
+    '''
+
+    import numpy
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    groups = [(None, table)] if hue is None else table.groupby(hue)
+    for level, sub in groups:
+        stats = sub.groupby(x)[y].agg(['mean', 'std', 'count'])
+        sem = stats['std'] / numpy.sqrt(stats['count'])
+        plt.errorbar(stats.index, stats['mean'], yerr=sem, fmt='o-',
+                     label=None if hue is None else '%s = %g' % (hue, level))
+    plt.xlabel(x)
+    plt.ylabel(y)
+    if hue is not None:
+        plt.legend(loc='best')
+    return fig
+
+def _drawjob(job):
+    '''
+    Draws and saves one figure of report, off screen.
+    '''
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from FitK import plotfit
+
+    kind, fname, args = job
+    if kind == 'subject':
+        title, km, data = args
+        fig = plotfit(km, data)
+        fig.set_size_inches(12, 4)
+    else:
+        title, table, x, y, hue = args
+        fig = groupplot(table, x, y, hue)
+        fig.set_size_inches(5, 4)
+    fig.suptitle(title)
+    fig.savefig(fname, dpi=80)
+    plt.close(fig)
+    return fname
+
+if __name__ == '__main__':
+
+    import sys
+
+    datadir = sys.argv[1] if len(sys.argv) > 1 else \
+              '/Users/christianrodriguez/Dropbox/Python/data'
+    outdir = sys.argv[2] if len(sys.argv) > 2 else None
+    print(report(datadir, outdir))
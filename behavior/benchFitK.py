@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: python benchFitK.py [out.csv [old.csv]]
+   or: table = benchfitk(); savebench(table, 'out.csv')
+       comparebench('old.csv', 'out.csv')
+
+Parameter recovery benchmark for FitK. Softmax-hyperbolic choosers with
+known (k, m) are simulated in bulk on the two designs used in the lab:
+  stair   the fixed-step staircase of stairK.py (useposterior=False), run for
+          all simulated subjects at once
+  wmitc   the offers of Gen_WMITC_offers.batchoffers made for the true (k, m),
+          the first ntrials of the shuffled set
+and every simulated subject is fitted with KFitter.fit. The true k run from
+shallow to steep discounters (.005 to .5). For every design, number of
+trials, fit setting and true (k, m) a row reports the mean wall time and
+function evaluations per fit (grid scoring is not counted), the bias and
+RMSE of log10(k) and log10(m), and the mean and largest LL gap to a
+reference fit of the same data (referencell: the better of grid starts and
+the L-BFGS-B multistart of the original fitk), which is 0 when the fit
+finds the optimum. A last row per design times raw likelihood evaluations
+(errorfit).
+
+Tables are written as CSV with fixed columns, so runs from different
+versions of the code can be compared with comparebench, which lists the
+rows where time, evaluations, RMSE or the LL gap got worse.
+
+@author: christianrodriguez
+"""
+
+COLUMNS = ('design', 'ntrials', 'init', 'nstarts', 'ktrue', 'mtrue', 'nsim',
+           'nfail', 'time', 'nfev', 'biaslogk', 'rmselogk', 'biaslogm',
+           'rmselogm', 'llgap', 'maxllgap')
+
+def simstair(k, m, ntrials=60, kval=.02, step=.01, rng=None):
+    '''
+    Runs the fixed-step staircase of stairK.py for choosers with parameters
+    k and m (arrays, one per simulated subject) and returns their trials as
+    an (n, ntrials, 5) array [ssamnt ssdel llamnt lldel choice]. k estimates
+    are kept above 1e-4 so the offers stay sensible.
+    '''
+
+    import numpy
+
+    if rng is None:
+        rng = numpy.random
+    k = numpy.asarray(k, dtype=float)
+    m = numpy.asarray(m, dtype=float)
+    n = len(k)
+    ssopts = numpy.array([(10, 0), (10, 15), (20, 0), (20, 15)], dtype=float)
+
+    kval = numpy.repeat(float(kval), n)
+    step = numpy.repeat(float(step), n)
+    kvals = [kval]
+    trials = numpy.empty((n, ntrials, 5))
+    for trial in range(ntrials):
+
+        # offers at the current indifference point of every subject
+        ss = ssopts[rng.randint(0, 4, n)]
+        ssval = ss[:,0]/(1 + kval*ss[:,1])
+        lldel = rng.randint(16, 46, n)
+        llamt = numpy.round(ssval + ssval*kval*lldel, 1)
+
+        # softmax choices of the simulated subjects
+        x = m*(llamt/(1 + k*lldel) - ss[:,0]/(1 + k*ss[:,1]))
+        ll = (rng.rand(n) < .5 + .5*numpy.tanh(.5*x)).astype(float)
+        trials[:,trial] = numpy.column_stack((ss, llamt, lldel, ll))
+
+        # adjust the k estimate and shrink the step on revisits
+        kval = numpy.maximum(numpy.where(ll == 0, kval + step, kval - step), 1e-4)
+        kvals.append(kval)
+        if trial > 4:
+            last = numpy.sort(numpy.column_stack(kvals[-5:]), 1)
+            nuniq = 1 + numpy.sum(numpy.diff(last, axis=1) != 0, 1)
+            step = numpy.where(nuniq <= 4, step*.95, step)
+
+    return trials
+
+def simwmitc(k, m, ntrials=160, rng=None):
+    '''
+    Choices of simulated subjects with parameters k and m on the first
+    ntrials of their WMITC offers. Returns an (n, ntrials, 5) array with
+    columns [r1 d1 r2 d2 choice], ordered like FitK expects (smaller sooner
+    first).
+    '''
+
+    import numpy
+    from Gen_WMITC_offers import batchoffers
+
+    if rng is None:
+        rng = numpy.random
+    k = numpy.asarray(k, dtype=float)
+    m = numpy.asarray(m, dtype=float)
+    seeds = rng.randint(0, 2**31 - 1, len(k))
+    offers = batchoffers(k, m, seeds)[0][:,:ntrials]
+
+    # put the sooner offer first
+    swap = offers[:,:,1] > offers[:,:,3]
+    trials = numpy.empty(offers.shape[:2] + (5,))
+    trials[:,:,:2] = numpy.where(swap[:,:,None], offers[:,:,2:], offers[:,:,:2])
+    trials[:,:,2:4] = numpy.where(swap[:,:,None], offers[:,:,:2], offers[:,:,2:])
+
+    kk = k[:,None]
+    x = m[:,None]*(trials[:,:,2]/(1 + kk*trials[:,:,3]) -
+                   trials[:,:,0]/(1 + kk*trials[:,:,1]))
+    trials[:,:,4] = rng.rand(*x.shape) < .5 + .5*numpy.tanh(.5*x)
+    return trials
+
+def benchfitk(designs=None, ks=(.005, .02, .08, .2, .5), ms=(.5, 2),
+              settings=None, nsim=20, seed=0):
+    '''
+    Runs the benchmark and returns its rows as a list of dicts with the keys
+    in COLUMNS. designs maps a design name to the numbers of trials to use
+    and settings is a list of keyword dicts for KFitter.fit.
+    '''
+
+    import numpy, time
+    from FitK import KFitter
+
+    if designs is None:
+        designs = {'stair': (30, 60), 'wmitc': (80, 160)}
+    if settings is None:
+        settings = [dict(nstarts=20), dict(nstarts=200), dict(init='grid')]
+    sims = {'stair': simstair, 'wmitc': simwmitc}
+    rng = numpy.random.RandomState(seed)
+
+    rows = []
+    for design in sorted(designs):
+        for ntrials in designs[design]:
+            for ktrue in ks:
+                for mtrue in ms:
+                    data = sims[design](numpy.repeat(ktrue, nsim),
+                                        numpy.repeat(mtrue, nsim), ntrials,
+                                        rng=rng)
+                    ref = referencell(data, rng=rng)
+                    for opts in settings:
+                        rows.append(_benchcell(data, opts, rng, ref,
+                                               design=design, ntrials=ntrials,
+                                               ktrue=ktrue, mtrue=mtrue))
+
+        # raw likelihood evaluations, 1000 (k, m) pairs per call
+        data = sims[design](numpy.repeat(.02, 1), numpy.repeat(1., 1),
+                            max(designs[design]), rng=rng)[0]
+        fitter = KFitter(data)
+        km = numpy.column_stack((rng.rand(1000)*.1, rng.rand(1000)*5))
+        ncalls = 0
+        start = time.time()
+        while time.time() - start < .5:
+            fitter.error(km)
+            ncalls = ncalls + 1
+        row = dict.fromkeys(COLUMNS, float('nan'))
+        row.update(design=design, ntrials=len(data), init='errorfit',
+                   nstarts=1000, nsim=ncalls, nfail=0,
+                   time=(time.time() - start)/ncalls)
+        rows.append(row)
+
+    return rows
+
+def referencell(data, nstarts=20, rng=None):
+    '''
+    Reference LL of every simulated subject in data: the better of the fit
+    from grid starts and an L-BFGS-B fit from nstarts starts drawn like the
+    original fitk did (k up to .02, m up to 2), plus one from the grid
+    optimum.
+    '''
+
+    import numpy
+    from scipy import optimize
+    from FitK import KFitter
+
+    if rng is None:
+        rng = numpy.random
+    ref = numpy.empty(len(data))
+    for i, trials in enumerate(data):
+        fitter = KFitter(trials)
+        k, m, ref[i] = fitter.fit(init='grid')[:3]
+        starts = numpy.column_stack((rng.rand(nstarts)*.02, rng.rand(nstarts)*2))
+        for km0 in numpy.vstack((starts, [k, m])):
+            opt = optimize.minimize(fitter.errorfit, km0, jac=fitter.errorgrad,
+                                    method='L-BFGS-B', bounds=fitter.bounds)
+            if numpy.isfinite(opt.fun):
+                ref[i] = max(ref[i], -opt.fun)
+    return ref
+
+def _benchcell(data, opts, rng, ref, **row):
+    '''
+    Fits every simulated subject in data with opts, returns the summary row.
+    ref holds the reference LL of every subject (see referencell).
+    '''
+
+    import numpy, time
+    from FitK import KFitter
+
+    est = numpy.full((len(data), 2), numpy.nan)
+    gap = numpy.full(len(data), numpy.nan)
+    times = numpy.zeros(len(data))
+    nfev = numpy.zeros(len(data))
+    for i, trials in enumerate(data):
+        start = time.time()
+        try:
+            k, m, LL, res = KFitter(trials).fit(seed=rng, **opts)
+        except RuntimeError:
+            continue
+        times[i] = time.time() - start
+        nfev[i] = res.nfev.sum()
+        est[i] = k, m
+        gap[i] = ref[i] - LL
+
+    # errors in log10 units, estimates at the lower bound count as failures
+    ok = numpy.all(est > [b[0] for b in KFitter.bounds], 1)
+    err = numpy.log10(est[ok]) - numpy.log10([row['ktrue'], row['mtrue']])
+    row.update(init=opts.get('init', 'random'),
+               nstarts=opts.get('npolish', 5) if opts.get('init') == 'grid'
+                       else opts.get('nstarts', 1000),
+               nsim=len(data), nfail=len(data) - ok.sum(),
+               time=times.mean(), nfev=nfev.mean(),
+               biaslogk=err[:,0].mean(), rmselogk=numpy.sqrt(numpy.mean(err[:,0]**2)),
+               biaslogm=err[:,1].mean(), rmselogm=numpy.sqrt(numpy.mean(err[:,1]**2)),
+               llgap=numpy.nanmean(gap), maxllgap=numpy.nanmax(gap))
+    return row
+
+def savebench(rows, fname):
+    '''
+    Writes benchmark rows to a CSV file with the columns in COLUMNS.
+    '''
+
+    f = open(fname, 'w')
+    f.write(','.join(COLUMNS) + '\n')
+    for row in rows:
+        f.write(','.join(str(row[c]) for c in COLUMNS) + '\n')
+    f.close()
+
+def loadbench(fname):
+    '''
+    Reads a CSV file written by savebench into a list of dicts.
+    '''
+
+    f = open(fname)
+    names = f.readline().strip().split(',')
+    rows = []
+    for line in f:
+        row = dict(zip(names, line.strip().split(',')))
+        for c in names[1:]:
+            row[c] = row[c] if c == 'init' else float(row[c])
+        rows.append(row)
+    f.close()
+    return rows
+
+def comparebench(old, new, slower=1.2, worse=.02):
+    '''
+    Compares two benchmark files (or lists of rows). Returns the rows of new
+    whose time or nfev grew by more than the factor slower, whose RMSE grew
+    by more than worse (log10 units) or whose mean LL gap grew by more than
+    worse, as (key, column, old, new) tuples. Files written before the LL
+    gap was recorded are compared on the other columns.
+    '''
+
+    if not isinstance(old, list):
+        old = loadbench(old)
+    if not isinstance(new, list):
+        new = loadbench(new)
+
+    key = lambda r: tuple(r[c] for c in COLUMNS[:6])
+    before = dict((key(r), r) for r in old)
+    found = []
+    for row in new:
+        if key(row) not in before:
+            continue
+        prev = before[key(row)]
+        for c in ('time', 'nfev'):
+            if row[c] > slower*prev[c]:
+                found.append((key(row), c, prev[c], row[c]))
+        for c in ('rmselogk', 'rmselogm', 'llgap'):
+            if c in prev and row[c] > prev[c] + worse:
+                found.append((key(row), c, prev[c], row[c]))
+    return found
+
+if __name__ == '__main__':
+
+    import sys, time
+
+    fname = sys.argv[1] if len(sys.argv) > 1 else \
+            'benchFitK_%s.csv' % time.strftime('%Y%m%d_%H%M%S')
+    rows = benchfitk()
+    savebench(rows, fname)
+    for row in rows:
+        print('%-6s %4d %-8s %5d k=%-6g m=%-4g  %8.2f ms  %7.0f fev  '
+              'logk %+.3f (%.3f)  logm %+.3f (%.3f)  LL gap %.3f (max %.3f)' %
+              (row['design'], row['ntrials'], row['init'], row['nstarts'],
+               row['ktrue'], row['mtrue'], 1000*row['time'], row['nfev'],
+               row['biaslogk'], row['rmselogk'], row['biaslogm'],
+               row['rmselogm'], row['llgap'], row['maxllgap']))
+    if len(sys.argv) > 2:
+        for key, c, before, after in comparebench(sys.argv[2], rows):
+            print('worse: %s %s %g -> %g' % (key, c, before, after))
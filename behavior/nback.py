@@ -11,7 +11,10 @@ be ran or get commented out. Before the letter stream starts, the condition
 intruction screen is presented. The letters then appear with fixation cross 
 periods in between letters. After a whole block of letters the script waits some
 time and moves on. The subject responses are logged along with the start times
-for bloks and trials. 
+for bloks and trials. All screens are preloaded and all onsets are computed
+from the scanner trigger up front, and every screen waits for its own deadline
+(see Schedule.py), so timing overheads do not add up over the run. Intended and actual onsets are saved to
+data/onsets.
 
 For some background see: http://en.wikipedia.org/wiki/N-back
 
@@ -36,6 +39,7 @@ secs = 10            # seconds to wait if warining screen is ran
 
 from expyriment import design, control, stimuli, misc
 import os, random, serial
+from Schedule import Schedule, nbackschedule
 
 # make sure the script runs on the appropriate directory
 maindir = '/Users/christianrodriguez/Dropbox/Python'
@@ -69,6 +73,28 @@ response_device = exp.keyboard
 fixcross = stimuli.FixCross(colour=white, size= crossize)
 fixcross.preload()
 
+# build and preload the block, letter and rest screens of the whole run, so
+# nothing is rendered between the scanner trigger and the end of the run
+blockscreens = []
+letterscreens = []
+for blocknum in range(len(stims)):
+    text = 'Get ready for 1-back.' if blocknum < 4 else 'Get ready for 2-back.'
+    screen = stimuli.TextScreen('', text, text_size= tsize, text_colour=white)
+    screen.preload()
+    blockscreens = blockscreens + [screen]
+    screens = []
+    for letter in stims[blocknum]:
+        screen = stimuli.BlankScreen()
+        stim1 = stimuli.TextLine(text=letter, position=pos,
+                                 text_size=tsize, text_colour=white)
+        stim1.plot(screen)
+        screen.preload()
+        screens = screens + [screen]
+    letterscreens = letterscreens + [screens]
+restscreen = stimuli.TextScreen('', 'This is a rest period. Relax!',
+                                text_size= instsize, text_colour=white)
+restscreen.preload()
+
 # name variables to be collected
 exp.data_variable_names = ['block','cond','trial','resp','RT','correct',
 'blctime','trltime']
@@ -133,67 +159,62 @@ ser.close() # close port
 # start clock and get the a relative t = 0 mark
 clock = misc.Clock()
 strtt = clock.monotonic_time()
+# waits process the escape key
+sched = Schedule(strtt, now=clock.monotonic_time,
+                 wait=lambda ms: exp.clock.wait(ms, process_control_events=True))
         
 # wait for several seconds to allow for signal saturation
-while secs > 0:
-    intro = 'The task will start in %d seconds' % secs
-    stimuli.TextScreen('', intro, text_size= instsize, 
-                       text_colour= white).present()
-    exp.clock.wait(1000)
-    secs = secs - 1
+for sec in range(secs):
+    intro = 'The task will start in %d seconds' % (secs - sec)
+    intro = stimuli.TextScreen('', intro, text_size= instsize, 
+                               text_colour= white)
+    intro.preload()
+    sched.onset('countdown', 1000*sec, intro.present)
 
 # counterbalance the block order
 order = random.sample(range(len(stims)),len(stims))
 
+# onsets (ms from strtt) of the blocks, letters and rests, blocks start after
+# the countdown
+ibis = [random.randint(ibir[0],ibir[1]) for blocknum in order]
+blckons, letterons, restons = nbackschedule([len(stims[b]) for b in order],
+                                            ibis, inst, stimt, iti, 
+                                            start=1000*secs)
+
 # loop through blocks in order
 blckscompleted = 0
 
 for blocknum in order:
     
-    blctime = clock.monotonic_time() - strtt # when the block starts
-    
     # start trial count
     trialnum = 0
     
     # present the block type for 2 seconds
-    if blocknum < 4:
-        text = 'Get ready for 1-back.'
-        cond = 1
-    else:
-        text = 'Get ready for 2-back.'
-        cond = 2
-        
-    stimuli.TextScreen('', text, text_size= tsize, text_colour=white).present()
-    exp.clock.wait(inst)
+    cond = 1 if blocknum < 4 else 2
+    blctime = sched.onset('block', blckons[blckscompleted],
+                          blockscreens[blocknum].present,
+                          blocknum)/1000. # when the block starts (s)
 
     # present trials
     for trial in stims[blocknum]:
         
-        trltime = clock.monotonic_time() - strtt # when the trial starts
-    
-        # get the fixed offer, present and wait for some time       
-        screen = stimuli.BlankScreen()
-        stim1 = stimuli.TextLine(text=trial, position=pos,
-                                 text_size=tsize, text_colour=white)
-        stim1.plot(screen)   
-        screen.present()
+        # present the preloaded letter at its onset, when it starts (s)
+        ontime = letterons[blckscompleted][trialnum]
+        trltime = sched.onset('letter', ontime,
+                              letterscreens[blocknum][trialnum].present,
+                              '%d-%d' % (blocknum, trialnum))/1000.
         
         # collect response if it happens during presentation
         button, rt = response_device.wait_char([ntbutton,tbutton], 
-                                               duration=stimt)
-        if rt is not None:
-            exp.clock.wait(stimt-rt)
+                                               duration=sched.left(ontime+stimt))
         
-        # present fixation cross for some time
-        fixcross.present()
+        # present fixation cross until the next letter
+        sched.onset('fix', ontime+stimt, fixcross.present,
+                    '%d-%d' % (blocknum, trialnum))
         # if a response hasn't been made give another chance
         if rt is None:
             button, rt = response_device.wait_char([ntbutton,tbutton],
-                                                   duration=iti)
-            if rt is not None:            
-                exp.clock.wait(iti-rt)
-        else: # otherwise just present the delay window
-            exp.clock.wait(iti)
+                                        duration=sched.left(ontime+stimt+iti))
             
         # mark if response was correct
         stimletter = trial.lower()
@@ -231,10 +252,12 @@ for blocknum in order:
         
     # wait between blocks
     if blckscompleted < len(stims):
-        stimuli.TextScreen('', 'This is a rest period. Relax!',
-                       text_size= instsize, text_colour=white).present()
-        ibi = random.randint(ibir[0],ibir[1])
-        exp.clock.wait(ibi)
+        sched.onset('rest', restons[blckscompleted-1], restscreen.present,
+                    blocknum)
+
+# wait for the last fixation and save the onsets
+sched.until(restons[-1])
+sched.save('%s/data/onsets/nback_%s_onsets.csv' % (maindir, exp.subject))
 
 # End Experiment
 control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
\ No newline at end of file
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 Estimate hyperbolic parameters from the behavior observed during the fmri runs.
+Subjects are fitted in parallel, see nworkers and seed below.
 
 Created on Tue Sep 16 13:21:49 2014
 
@@ -9,68 +10,42 @@ Created on Tue Sep 16 13:21:49 2014
 """
 
 # imports
-from os import chdir
-from glob import glob
-import numpy as np
 import pandas as pd
+from FitK import fitcohort
+from FitCache import FitCache
+from TrialArray import trialarray
 
 scriptdir = '/Users/christianrodriguez/Dropbox/Python/scripts'
 datadir = '/Users/christianrodriguez/Dropbox/Python/data'
+nworkers = None # processes used for fitting, None uses all cores
+seed = 0        # base seed for the random starts of every subject
 
-# get behavioral files
-chdir(datadir)
-filz = glob('WMITC_*xpd')
+# the pool re-imports this script, so only the main process does the work
+if __name__ == '__main__':
 
-# make a list of subjects
-subs = []
-for f in filz:
-    subs = subs + [f[6:10]]
-subs = np.unique(subs)
+    # get the consolidated trials (new files are ingested first)
+    trials = trialarray(datadir)
+    subs = [s for s in trials.subjects if len(trials.subject(s, 'WMITC'))]
 
-# pre-allocate a params table
-paramsdata = np.empty([len(subs), 3])
-sindx = 0
+    # the trials of every subject in FitK order (sooner offer first, so 
+    # choice = 1 indicates a choice for the second column)
+    datasets = [trials.fitdata(s, 'WMITC') for s in subs]
+
+    # run the fitK function for all subjects, results come back in subject order
+    # subjects whose files did not change come straight from the cache
+    # (grid starts, like runFitK)
+    fitcache = FitCache('%s/fitted/cache' % (datadir))
+    paramsdata = fitcohort(datasets, nworkers=nworkers, seed=seed, cache=fitcache,
+                           init='grid')
 
-# loop through subjects
-for s in subs:
-    
-    # get the file names for the current subject
-    subfilz = [f for f in filz if f[6:10] == s]
-    
-    # concatenate the data from all files for this subject
-    alldata = np.genfromtxt('%s/%s' % (datadir, subfilz[0]), delimiter=',', skip_header=10)
-    for f in subfilz[1:]:
-        sessdata = np.genfromtxt('%s/%s' % (datadir, f), delimiter=',', skip_header=10)
-        alldata = np.concatenate((alldata, sessdata))
-        
-    # format the data for FitK function
-    data = pd.DataFrame(alldata[:,3:7])
-    
-    # if the first offer is $40 choice = 1 indicates choosing the first offer
-    # if the first offer is $20 choice = 1 indicates choosing the second offer
-    data[data.loc[:,0]==40] = data[data.loc[:,0]==40].loc[:,[2,3,0,1]]
-    # now choice = 1 indicates a choice for the second column
-    # append choices for second offer
-    data['choice'] = alldata[:,7]
-    
-    # import FitK functions
-    execfile('/Users/christianrodriguez/Dropbox/Python/scripts/FitK.py')
-    
-    # run the fitK function
-    k, m, ll, res = fitk(np.array(data))
-    
     # print the output to screen
-    print 'k = %.5f, m = %.3f, likelihood = %.5f' % (k, m, ll)
-    
-    # make a summary plot
-    #plotfit(np.array([k,m]))
-    
-    # collect values on params table
-    paramsdata[sindx,:] = [k, m, ll]
-    
-    # move index forward
-    sindx = sindx +1
-    
-# write a file to the fitted directory
-paramsdata = pd.DataFrame(paramsdata)
-paramsdata.to_csv('./fitted/InScanParams.csv')
+    for sindx, (k, m, ll) in enumerate(paramsdata):
+        print('%d: k = %.5f, m = %.3f, likelihood = %.5f' % (subs[sindx], k, m, ll))
+
+        # make a summary plot
+        #plotfit(np.array([k,m]), datasets[sindx])
+
+    # write a file to the fitted directory
+    paramsdata = pd.DataFrame(paramsdata)
+    paramsdata['subject_id'] = subs
+    paramsdata.to_csv('%s/fitted/InScanParams.csv' % (datadir))
@@ -1,66 +1,88 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
+Usage: python runFitK.py
+   or: k, m, ll, res = fitsubject(6001, datadir, plot=False)
+
+Fits the staircase session of one subject and writes its parameters to
+<datadir>/fitted/<subject>_fitkparams.txt (see also behaviorcli.py fit).
+
 Created on Tue Sep 16 13:21:49 2014
 
 @author: christianrodriguez
 """
 
-# imports
-from os import chdir
-from glob import glob
-import numpy
-
 scriptdir = '/Users/christianrodriguez/Dropbox/Python/scripts'
 datadir = '/Users/christianrodriguez/Dropbox/Python/data'
 #scriptdir = '/Users/Marjolein/Dropbox/Python/scripts'
 #datadir = '/Users/Marjolein/Dropbox/Python/data'
 
-# get the subject number
-subn = input('Which subject do you want to fit?  ')
+def fitsubject(subn, datadir=datadir, plot=True):
+    '''
+    Fits the staircase trials of subject subn, writes the parameters and
+    the likelihood surface to <datadir>/fitted and makes the summary plots
+    if plot is True (matplotlib is only imported then). Returns what
+    cachedfitk returns.
+    '''
+
+    # imports
+    import os
+    import numpy
+    from FitK import plotfit, plotsurface
+    from FitCache import FitCache, cachedfitk
+    from TrialStore import trialstore
+
+    # fill in with a leading zero for file name
+    subn = int(subn)
+    subns = subn.__str__().zfill(2)
+
+    # get the staircase trials from the trial store (new files are ingested first)
+    store = trialstore(datadir, 'stairK')
+    fitkd = store.trials(subn, session=1, 
+                         columns=['ssamnt', 'ssdel', 'llamnt', 'lldel', 'choice'])
 
-# fill in with a leading zero for file name
-subns = subn.__str__().zfill(2)
+    #if subn <= 8:
+    #    fitkd[:,-1] = 1-fitkd[:,-1] # one time exception because of error
 
-# get the file
-#fname = '%s/stairK%s'
-chdir(datadir)
-filz = glob('stairK_%s_*xpd' % (subns))
+    # run the fitK function, polishing the best cells of a likelihood grid
+    # (unchanged data is read back from the cache instead of being refitted)
+    fitcache = FitCache('%s/fitted/cache' % (datadir))
+    k, m, ll, res = cachedfitk(fitkd, fitcache, init='grid')
 
-# import the data, skipping the first 10 lines used as header
-data = numpy.genfromtxt('%s/%s' % (datadir, filz[0]), delimiter=',', skip_header=10)
+    # print the output to screen
+    print('k = %.5f, m = %.3f, likelihood = %.5f' % (k, m, ll))
 
-fitkd = data[:,3:]
-fitkd = fitkd[:,:-1]
+    # make a summary plot
+    if plot:
+        plotfit(numpy.array([k,m]), fitkd)
+        plotsurface(res.surface, [k, m])
 
-#if subn <= 8:
-#    fitkd[:,-1] = 1-fitkd[:,-1] # one time exception because of error
+    # cd to fitKdata
+    if  not os.path.isdir('%s/fitted' % (datadir)):
+        os.mkdir('%s/fitted' % (datadir))
 
-# import FitK functions
-execfile('/Users/christianrodriguez/Dropbox/Python/scripts/FitK.py')
-#execfile('/Users/Marjolein/Dropbox/Python/scripts/FitK.py')
+    # write a file to the fitted directory
+    f = open('%s/fitted/%s_fitkparams.txt' % (datadir, subns), 'w')
+    f.write('"k","m","ll"\n')
+    f.write('%f, %f, %f\n' % (k, m, ll))
+    f.close()
 
-# run the fitK function
-k, m, ll, res = fitk(fitkd)
+    # keep the likelihood surface for diagnostics
+    ks, ms, nll = res.surface
+    numpy.savez('%s/fitted/%s_llsurface.npz' % (datadir, subns), k=ks, m=ms, nll=nll)
 
-# print the output to screen
-print 'k = %.5f, m = %.3f, likelihood = %.5f' % (k, m, ll)
+    return k, m, ll, res
 
-# make a summary plot
-plotfit(numpy.array([k,m]))
+if __name__ == '__main__':
 
-# cd to fitKdata
-if  not os.path.isdir('%s/fitted' % (datadir)):
-    os.mkdir('%s/fitted' % (datadir))
+    from os import chdir
 
-# write a file to the fitted directory
-f = open('%s/fitted/%s_fitkparams.txt' % (datadir, subns), 'w')
-f.write('"k","m","ll"\n')
-f.write('%f, %f, %f\n' % (k, m, ll))
-f.close()
+    # get the subject number
+    subn = input('Which subject do you want to fit?  ')
 
-# get back to scriptdir and run the offer generation script
-chdir(scriptdir)
+    fitsubject(subn)
 
-#execfile('Gen_WMITC_offers.py')
+    # get back to scriptdir and run the offer generation script
+    chdir(scriptdir)
 
+    #execfile('Gen_WMITC_offers.py')
@@ -6,7 +6,13 @@ This script runs a staircase procedure that estimates a subject's temporal
 discounting preferences, asuming a hyperbolic discounting function. The smaller
 sooner offer is selected from a small range of options. Delays for the larger
 offer are selected with uniform probability, from a range of between 16 and 45 
-days.
+days. With useposterior the k estimate is the mean of a grid posterior over
+(k, m) (see BayesK) instead of a fixed-step staircase, and the task stops as
+soon as the posterior of k is narrow enough. With adaptivedesign the next 
+offer is the candidate with the largest expected information gain under the
+posterior, chosen during the ITI within a fixed compute budget. With 
+makeoffers the choices are fitted and the WMITC offers written right after
+the last trial (see StairToOffers).
  
 Check out:	
 http://en.wikipedia.org/wiki/Hyperbolic_discounting
@@ -15,6 +21,8 @@ http://en.wikipedia.org/wiki/Hyperbolic_discounting
 
 from expyriment import design, control, stimuli
 import random, numpy, os
+from BayesK import KPosterior, offergrid
+from StairToOffers import stairtooffers
 
 # make sure the script runs on the appropriate directory
 #os.chdir('/Users/christianrodriguez/Dropbox/Python')
@@ -24,6 +32,12 @@ os.chdir('/Users/Marjolein/Dropbox/Python')
 ntrials = 60
 kval = .02
 step = .01
+useposterior = True   # update k with a grid posterior instead of fixed steps
+target = .1           # stop once the posterior sd of log10(k) is this small
+mintrials = 10        # but never before this many trials
+adaptivedesign = True # pick offers by expected information gain (needs posterior)
+designbudget = 100    # ms allowed for picking an offer (ITI is at least 300)
+makeoffers = True     # fit the choices and write the WMITC offers at the end
 box_size = (100, 100)
 exp = design.Experiment('WM ITC')
 control.defaults.initialize_delay = 0
@@ -62,12 +76,15 @@ You can take that time to blink or just wait for the next trial.\n\n\n\
 Press any key to start the task."
 
 # staircase scren builder
-def itc_stair(kval, curr_trial):
+def itc_stair(kval, curr_trial, offer=None):
     
     screen = stimuli.BlankScreen()
     
     # make the offer strings to place on screen
-    ss = random.choice([(10, 0), (10, 15), (20,0), (20, 15)])
+    if offer is None:
+        ss = random.choice([(10, 0), (10, 15), (20,0), (20, 15)])
+    else:
+        ss = (int(offer[0]), int(offer[1]))
     ssval = ss[0]/(1+kval*ss[1])
     
     if ss[1]==0:
@@ -75,8 +92,12 @@ def itc_stair(kval, curr_trial):
     else:
         sstext = '$'+'%.2f' % (ss[0])+'\n'+str(ss[1])+' days'
         
-    lldel = random.randint(16,45)
-    llamt = round(ssval+ssval*kval*lldel,1)
+    if offer is None:
+        lldel = random.randint(16,45)
+        llamt = round(ssval+ssval*kval*lldel,1)
+    else:
+        lldel = int(offer[3])
+        llamt = round(offer[2],1)
     lltext = '$'+'%.2f' % llamt+'\n'+str(lldel)+' days'
     
     lstim = stimuli.TextBox(text=sstext, size=box_size, position=sspos, \
@@ -104,37 +125,68 @@ response_device.wait()
 # loop for specified number of trials
 trial = 0
 kvals = numpy.array([kval])
+trials = []
+post = KPosterior()
+adaptivedesign = adaptivedesign and useposterior
+if adaptivedesign:
+    candidates = offergrid(kmax=post.ks.max())
+    offer = candidates[post.bestoffer(candidates, designbudget/1000.)[0]]
+else:
+    offer = None
 while trial < ntrials:
     
     # present trial
-    ss, llamt, lldel = itc_stair(kval, trial)
+    ss, llamt, lldel = itc_stair(kval, trial, offer)
     
     # collect behavior
     button, rt = response_device.wait_char(['f','j'])
     
     # present ITI screen
     fixcross.present()
-    exp.clock.wait(random.randint(300,500))
+    itistart = exp.clock.time
+    iti = random.randint(300,500)
 
-    # adjust the k estimate
+    # code the choice
     if 'f' in button:
-        kval = kval + step
         ll = 0
     elif 'j' in button:
-        kval = kval - step
         ll = 1
+
+    # adjust the k estimate (during the ITI)
+    if useposterior:
+        post.update(ss[0], ss[1], llamt, lldel, ll)
+        kval = post.estimate()[0]
+    elif ll == 0:
+        kval = kval + step
+    else:
+        kval = kval - step
         
     # keep track of k values
     kvals = numpy.concatenate((kvals, numpy.array([kval])))
         
     # decrease step size if a k is revisited within 5 consequetive trials
-    if trial > 4 and len(numpy.unique(kvals[-5:]))<=4:
+    if not useposterior and trial > 4 and len(numpy.unique(kvals[-5:]))<=4:
         step = step *.95
     
+    # pick the most informative next offer (during the ITI)
+    if adaptivedesign:
+        offer = candidates[post.bestoffer(candidates, designbudget/1000.)[0]]
+    
+    # wait for the rest of the ITI
+    exp.clock.wait(iti - (exp.clock.time - itistart))
+    
     # add data to file
     exp.data.add([trial, round(kval,3), ss[0], ss[1], llamt, lldel, ll, rt])
+    trials.append([ss[0], ss[1], llamt, lldel, ll])
     trial = trial + 1
+    
+    # stop once k is known well enough
+    if useposterior and post.done(target, mintrials):
+        break
+
+# fit the choices and make the offers for the WMITC task
+if makeoffers:
+    stairtooffers(numpy.array(trials), exp.subject, 'data')
 
 # End Experiment
-control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
-#execfile('runFitK.py',)
\ No newline at end of file
+control.end(goodbye_text=None, goodbye_delay=None, fast_quit=None)
\ No newline at end of file
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for BayesK (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+import numpy
+
+from BayesK import simposterior
+
+def test_adaptive_staircase_recovers_steep_discounter():
+    for seed in range(3):
+        trials, post = simposterior(.5, 1., ntrials=60,
+                                    rng=numpy.random.RandomState(seed))
+        assert len(trials) < 60
+        assert post.width() <= .1
+        assert abs(numpy.log10(post.estimate()[0] / .5)) < .15
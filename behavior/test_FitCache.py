@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for FitCache (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+from test_FitK import simtrials
+
+def test_cohort_entries_keep_the_surface(tmpdir):
+    from FitK import fitcohort
+    from FitCache import FitCache, cachedfitk
+
+    cache = FitCache(str(tmpdir))
+    data = simtrials()
+    params = fitcohort([data], nworkers=1, progress=False, cache=cache,
+                       init='grid')
+
+    k, m, LL, res = cachedfitk(data, cache, init='grid')
+    assert res.cached
+    assert (k, m, LL) == tuple(params[0])
+    ks, ms, nll = res.surface
+    assert nll.shape == (len(ks), len(ms))
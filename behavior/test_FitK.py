@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for FitK (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+import numpy
+
+from FitK import KFitter
+
+def simtrials(k=.02, m=1., n=80, seed=0):
+    '''
+    Softmax-hyperbolic choices of one simulated subject.
+    '''
+
+    rng = numpy.random.RandomState(seed)
+    data = numpy.column_stack((rng.randint(5, 25, n), numpy.zeros(n),
+                               rng.randint(25, 60, n), rng.randint(1, 90, n),
+                               numpy.zeros(n))).astype(float)
+    x = m*(data[:,2]/(1 + k*data[:,3]) - data[:,0])
+    data[:,4] = rng.rand(n) < 1/(1 + numpy.exp(-x))
+    return data
+
+def test_missing_choices_count_as_ss():
+    data = simtrials()
+    missed = data.copy()
+    missed[[3, 10, 40], 4] = numpy.nan
+    coded = data.copy()
+    coded[[3, 10, 40], 4] = 0
+
+    km = numpy.array([[.02, 1.], [.1, .5]])
+    nll = KFitter(missed).error(km)
+    assert numpy.all(numpy.isfinite(nll))
+    assert numpy.allclose(nll, KFitter(coded).error(km))
+
+    k, m, LL, res = KFitter(missed).fit(nstarts=20, seed=0)
+    assert numpy.isfinite(LL)
+
+def test_group_fitters_share_choice_coding():
+    from GroupFitK import GroupFitter
+    from DiscountModels import ModelFitter
+
+    data = simtrials(n=60)
+    data[[3, 10, 40], 4] = numpy.nan
+    subj = numpy.repeat([1, 2], 30)
+
+    km = numpy.array([[.02, 1.], [.1, .5]])
+    single = [KFitter(data[subj == s]).error(km[i:i+1])[0]
+              for i, s in enumerate((1, 2))]
+    assert numpy.allclose(GroupFitter(data, subj).error(km), single)
+    assert numpy.allclose(ModelFitter('hyperbolic', data, subj).error(km),
+                          single)
+
+def test_random_starts_recover_steep_discounters():
+    from benchFitK import simstair
+
+    rng = numpy.random.RandomState(0)
+    for k in (.2, .5):
+        for data in simstair([k]*3, [1.]*3, rng=rng):
+            LL = KFitter(data).fit(seed=0)[2]
+            assert numpy.isclose(LL, KFitter(data).fit(init='grid')[2],
+                                 atol=1e-4)
+            assert LL > len(data)*numpy.log(.5) + 1
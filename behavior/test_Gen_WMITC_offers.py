@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for Gen_WMITC_offers (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+import warnings
+
+def test_genoffers_warns_about_clipped_offers():
+    from Gen_WMITC_offers import genoffers
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        genoffers(.02, 1., seed=0)
+        assert not caught
+        genoffers(1., .02, seed=0)
+    assert len(caught) == 1
+    assert 'of 160 offers' in str(caught[0].message)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for StairToOffers (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+import numpy
+
+def test_session_to_offers(tmpdir):
+    from benchFitK import simstair
+    from StairToOffers import stairtooffers
+
+    # the trials stairK.py collects in one session
+    rng = numpy.random.RandomState(0)
+    trials = simstair([.02], [1.], rng=rng)[0]
+    datadir = str(tmpdir)
+
+    k, m, ll, offers = stairtooffers(trials, 3, datadir)
+
+    params = numpy.genfromtxt('%s/fitted/03_fitkparams.txt' % (datadir),
+                              delimiter=',', skip_header=1)
+    assert numpy.allclose(params, (k, m, ll), atol=1e-6)
+    stored = numpy.genfromtxt('%s/offers/03_offers.txt' % (datadir),
+                              delimiter=',', skip_header=1)
+    assert stored.shape == offers.shape == (160, 4)
+    assert numpy.allclose(stored, offers, atol=.005)
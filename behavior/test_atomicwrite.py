@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for atomicwrite (run with pytest from this directory).
+
+@author: christianrodriguez
+"""
+
+import os
+
+from atomicwrite import atomicwrite
+
+def test_replaces_or_keeps_the_old_file(tmpdir):
+    fname = str(tmpdir.join('sub', 'table.txt'))
+    with atomicwrite(fname) as tmp:
+        assert tmp.endswith('.txt')
+        f = open(tmp, 'w')
+        f.write('old')
+        f.close()
+
+    try:
+        with atomicwrite(fname) as tmp:
+            f = open(tmp, 'w')
+            f.write('half')
+            f.close()
+            raise RuntimeError('stopped while writing')
+    except RuntimeError:
+        pass
+    assert open(fname).read() == 'old'
+    assert os.listdir(os.path.dirname(fname)) == ['table.txt']
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Usage: data = choicevalues(data, params)
+       data = choicevalues(data, inscanparams, k='0', m='1', prefix='is')
+       tables = SummaryCache('/path/to/summaries.pkl').update(data)
+       results = analyze(datadir)
+   or: python wmitcanalysis.py [datadir [outdir]]
+
+Analysis helpers for the WMITC trial table (one row per trial, with the
+columns of the WMITC data files). choicevalues joins the table to a table
+of per-subject hyperbolic-softmax parameters once and computes the
+subjective values and choice probabilities of all trials in one vectorized
+pass, with every subject's own k and m.
+
+SummaryCache keeps the per-subject summary tables of SUMMARIES (choice means
+by pll and famnt, median RT by difficulty, ...) on disk, together with a
+hash of the trials of every subject. update recomputes the summaries of new
+or changed subjects only, so the group tables are ready right away while
+data collection goes on. For the summaries not to depend on which subjects
+were added together, pll is binned with fixed labels (PLL).
+
+analyze runs the whole analysis without IPython or plots: it loads the
+summaries (loadtables: trials, parameters and summary cache) and fits the
+mixed models of MIXEDMODELS, each one in its own process (see fitbattery).
+The summary of every model is written to <outdir>/<name>.txt and all
+coefficients to <outdir>/mixedmodels.csv.
+
+@author: christianrodriguez
+"""
+
+# the design p values of pll (Gen_WMITC_offers.pll), used as bin labels
+PLL = (.1, .4, .6, .9)
+
+# summary tables: name -> (grouping columns besides subject_id, column, statistic)
+SUMMARIES = {'p':   (('pll', 'famnt'), 'choice', 'mean'),
+             'pb':  (('pll',), 'choice', 'mean'),
+             'p2':  (('ispll', 'famnt'), 'choice', 'mean'),
+             'p2b': (('ispll',), 'choice', 'mean'),
+             'rt':  (('pll',), 'RT', 'median'),
+             'rt2': (('ispll',), 'RT', 'median'),
+             'rt3': (('pllsqrd',), 'RT', 'median'),
+             'rt4': (('ispllsqrd',), 'RT', 'median')}
+
+def choicevalues(data, params, k='k', m='m', prefix='', labels=None):
+    '''
+    Adds the columns fsv and ssv (discounted values of the first and second
+    offer), psoffer (softmax p of choosing the second offer), pll (p of
+    choosing the ll offer, binned by binpll with labels) to data, each name
+    preceded by prefix. params needs a subject_id column and the columns
+    named by k and m. Trials of subjects without parameters get nan.
+    Returns data.
+    '''
+
+    import numpy, pandas
+
+    # position of every trial's subject in params, found once
+    params = params.drop_duplicates('subject_id')
+    pos = pandas.Index(params['subject_id'].astype(float)).get_indexer(
+        data['subject_id'].astype(float))
+    known = pos >= 0
+    kk = numpy.where(known, numpy.asarray(params[k], dtype=float)[pos], numpy.nan)
+    mm = numpy.where(known, numpy.asarray(params[m], dtype=float)[pos], numpy.nan)
+
+    # discounted values and softmax p for the second offer
+    fsv = data['famnt'].values / (1 + kk*data['fdel'].values)
+    ssv = data['pamnt'].values / (1 + kk*data['pdel'].values)
+    psoffer = 1 / (1 + numpy.exp(-mm*(ssv - fsv)))
+
+    # p for the ll offer, when the first offer is ll pll=1-psoffer
+    pll = numpy.where(data['famnt'].values == 40, 1 - psoffer, psoffer)
+
+    data[prefix + 'fsv'] = fsv
+    data[prefix + 'ssv'] = ssv
+    data[prefix + 'psoffer'] = psoffer
+    data[prefix + 'pll'] = binpll(pll, labels=labels)
+    return data
+
+def binpll(pll, edges=(.25, .5, .75), labels=None):
+    '''
+    Forces p values into the four intended categories (needed for summary
+    statistics): every p is replaced by the label of its bin, by default
+    the mean p of the bin rounded to one decimal. nan stays nan.
+    '''
+
+    import numpy
+
+    pll = numpy.asarray(pll, dtype=float)
+    out = numpy.full(pll.shape, numpy.nan)
+    fin = numpy.isfinite(pll)
+    bins = numpy.digitize(pll[fin], edges, right=True)
+    if labels is not None:
+        out[fin] = numpy.asarray(labels, dtype=float)[bins]
+        return out
+    nbins = len(edges) + 1
+    means = numpy.bincount(bins, weights=pll[fin], minlength=nbins) / \
+            numpy.maximum(numpy.bincount(bins, minlength=nbins), 1)
+    out[fin] = numpy.round(means, 1)[bins]
+    return out
+
+def summaries(data):
+    '''
+    The tables of SUMMARIES for the trials in data, each with one row per
+    subject and group (like groupby(...).mean().reset_index()).
+    '''
+
+    data = data.assign(pllsqrd=(data['pll'] - .5)**2,
+                       ispllsqrd=(data['ispll'] - .5)**2)
+    tables = {}
+    for name, (by, col, stat) in SUMMARIES.items():
+        groups = data.groupby(['subject_id'] + list(by))[col]
+        tables[name] = getattr(groups, stat)().reset_index()
+    return tables
+
+# mixed models (name, summary table, formula), grouped by subject
+MIXEDMODELS = [('choice_pll_famnt',   'p',   'choice ~ pll * famnt'),
+               ('choice_pll',         'pb',  'choice ~ pll'),
+               ('choice_ispll_famnt', 'p2',  'choice ~ ispll * famnt'),
+               ('choice_ispll',       'p2b', 'choice ~ ispll'),
+               ('rt_pllsqrd',         'rt',  'RT ~ pllsqrd'),
+               ('rt_ispllsqrd',       'rt2', 'RT ~ pllsqrd')]
+
+# subjects left out of the group analyses
+EXCLUDE = (6014, 6016)
+
+class SummaryCache(object):
+    '''
+    Per-subject summaries of the trial table kept in the pickle file fname.
+    '''
+
+    # columns that the summaries depend on
+    columns = ('famnt', 'fdel', 'pamnt', 'pdel', 'choice', 'RT', 'pll', 'ispll')
+
+    def __init__(self, fname):
+
+        import pandas
+
+        self.fname = fname
+        try:
+            self.keys, self.tables = pandas.read_pickle(fname)
+        except (IOError, OSError, EOFError, ValueError):
+            self.keys, self.tables = {}, {}
+
+    def subjectkeys(self, data):
+        '''
+        Hash of the trials (the columns the summaries use) of every subject.
+        '''
+
+        import hashlib, numpy
+
+        subj = data['subject_id'].values.astype(float)
+        order = numpy.argsort(subj, kind='mergesort')
+        values = numpy.ascontiguousarray(
+            data[list(self.columns)].values.astype(float)[order])
+        subjects, first = numpy.unique(subj[order], return_index=True)
+        last = numpy.append(first[1:], len(order))
+        return dict((s, hashlib.sha1(values[a:b].tobytes()).hexdigest())
+                    for s, a, b in zip(subjects, first, last))
+
+    def update(self, data):
+        '''
+        Brings the summaries up to date with data (the whole trial table):
+        subjects that are new or whose trials changed are summarized again,
+        subjects no longer in data are dropped. Saves the cache and returns
+        the group tables (name -> DataFrame).
+        '''
+
+        import pandas
+        from atomicwrite import atomicwrite
+
+        keys = self.subjectkeys(data)
+        redo = [s for s in keys if self.keys.get(s) != keys[s]]
+        gone = [s for s in self.keys if s not in keys]
+        if not redo and not gone and self.tables:
+            return self.tables
+
+        new = summaries(data[data['subject_id'].isin(redo)])
+        for name in SUMMARIES:
+            old = self.tables.get(name)
+            if old is not None:
+                old = old[~old['subject_id'].isin(redo + gone)]
+                new[name] = pandas.concat([old, new[name]], ignore_index=True)
+            by = ['subject_id'] + list(SUMMARIES[name][0])
+            self.tables[name] = new[name].sort_values(by).reset_index(drop=True)
+        self.keys = keys
+
+        # readers never see half a cache
+        with atomicwrite(self.fname) as tmp:
+            pandas.to_pickle((self.keys, self.tables), tmp)
+        return self.tables
+
+def modeltables(tables, exclude=EXCLUDE):
+    '''
+    The summary tables used by MIXEDMODELS, without the excluded subjects
+    and with the squared difficulty (pllsqrd) added to the RT tables.
+    '''
+
+    out = {}
+    for name, table in tables.items():
+        out[name] = table[~table['subject_id'].isin(exclude)].reset_index(drop=True)
+    out['rt'] = out['rt'].assign(pllsqrd=(out['rt']['pll'] - .5)**2)
+    out['rt2'] = out['rt2'].assign(pllsqrd=(out['rt2']['ispll'] - .5)**2)
+    return out
+
+def fitbattery(tables, specs=MIXEDMODELS, nworkers=None):
+    '''
+    Fits the mixed models in specs (see MIXEDMODELS) to tables in a pool of
+    nworkers processes (one per model by default, 1 fits them here).
+    Returns a dict name -> (summary text, coefficient table).
+    '''
+
+    from FitK import poolmap
+
+    if nworkers is None:
+        nworkers = len(specs)
+    jobs = [(name, formula, tables[table]) for name, table, formula in specs]
+    return dict((name, (text, coef)) for name, text, coef in
+                poolmap(_fitmixed, jobs, nworkers))
+
+def _fitmixed(job):
+    '''
+    Fits one mixed model for fitbattery.
+    '''
+
+    import pandas
+    import statsmodels.formula.api as smf
+
+    name, formula, table = job
+    res = smf.mixedlm(formula, table, groups=table['subject_id']).fit()
+    coef = pandas.DataFrame({'coef': res.params, 'se': res.bse,
+                             'p': res.pvalues})
+    return name, res.summary().as_text(), coef
+
+def loadparams(datadir, subjects):
+    '''
+    Staircase parameters (from the _fitkparams.txt files) and in-scan
+    parameters (InScanParams.csv, as written by rerunFitK), both with a
+    subject_id column. Files from before rerunFitK wrote the subject_id
+    column hold the subjects with WMITC trials in sorted order; they are
+    matched to subjects, and a ValueError is raised if the numbers differ.
+    '''
+
+    import os, numpy, pandas
+    from glob import glob
+
+    parfilz = sorted(glob('%s/fitted/*_fitkparams.txt' % (datadir)))
+    params = pandas.concat([pandas.read_csv(f) for f in parfilz],
+                           ignore_index=True)
+    params['subject_id'] = [float(os.path.basename(f).split('_')[0])
+                            for f in parfilz]
+
+    fname = '%s/fitted/InScanParams.csv' % (datadir)
+    inscanparams = pandas.read_csv(fname, index_col=0)
+    if 'subject_id' in inscanparams:
+        inscanparams['subject_id'] = inscanparams['subject_id'].astype(float)
+    elif len(inscanparams) != len(subjects):
+        raise ValueError('%s has %d rows but there are %d subjects with WMITC '
+                         'trials, rerun rerunFitK.py' %
+                         (fname, len(inscanparams), len(subjects)))
+    else:
+        inscanparams['subject_id'] = numpy.sort(subjects).astype(float)
+    return params, inscanparams
+
+def loadtables(datadir):
+    '''
+    The summary tables of the WMITC data in datadir: loads the trials
+    (see TrialStore) and parameters, adds the choice variables and updates
+    the summary cache.
+    '''
+
+    import pandas
+    from TrialStore import trialstore
+
+    # trials and choice variables
+    store = trialstore(datadir, 'WMITC')
+    data = pandas.DataFrame(store.trials(), columns=store.names)
+    params, inscanparams = loadparams(datadir, store.subjects())
+    data = choicevalues(data, params, labels=PLL)
+    data = choicevalues(data, inscanparams, k='0', m='1', prefix='is',
+                        labels=PLL)
+
+    return SummaryCache('%s/fitted/summaries.pkl' % (datadir)).update(data)
+
+def analyze(datadir, outdir=None, nworkers=None, specs=MIXEDMODELS):
+    '''
+    Runs the analysis of the WMITC data in datadir and writes the model
+    summaries to outdir (<datadir>/analysis by default). Returns what
+    fitbattery returns.
+    '''
+
+    import os, pandas
+
+    if outdir is None:
+        outdir = '%s/analysis' % (datadir)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    # summaries and models
+    tables = loadtables(datadir)
+    results = fitbattery(modeltables(tables), specs, nworkers)
+
+    coefs = []
+    for name, _, formula in specs:
+        text, coef = results[name]
+        f = open('%s/%s.txt' % (outdir, name), 'w')
+        f.write('%s\n\n%s\n' % (formula, text))
+        f.close()
+        coefs.append(coef.assign(model=name, term=coef.index))
+    pandas.concat(coefs, ignore_index=True)[['model', 'term', 'coef', 'se', 'p']
+        ].to_csv('%s/mixedmodels.csv' % (outdir), index=False)
+
+    return results
+
+if __name__ == '__main__':
+
+    import sys
+
+    datadir = sys.argv[1] if len(sys.argv) > 1 else \
+              '/Users/christianrodriguez/Dropbox/Python/data'
+    outdir = sys.argv[2] if len(sys.argv) > 2 else None
+    for name, (text, coef) in sorted(analyze(datadir, outdir).items()):
+        print('%s\n%s' % (name, coef))
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage: screens = prepareoffers(blockoffers(offers, blck))
+       fscreen, pscreen = screens[trial]
+   or: python wmitcstim.py [offers.txt]     (off screen self-test)
+
+Offer screens of WMITC.py, rendered and preloaded before the run starts.
+prepareoffers builds the screen of the first offer (yellow) and of the
+second offer (green) of every trial of a block and preloads them, so during
+the run a trial only presents surfaces that are ready and no text is
+rendered between the fixation cross and the offer onsets (foffert, poffert).
+
+The self-test runs in expyriment's develop mode with SDL's dummy video and
+audio drivers, without OpenGL and without event logging (no window, sound
+card or events/ files needed), prepares a 40-trial block and compares the
+time to present a prepared screen with the time to build and present it
+inside the trial, like WMITC.py used to do.
+
+@author: christianrodriguez
+"""
+
+FIRST  = (255,255,0) # colour of the first offer
+SECOND = (0,255,0)   # colour of the second offer
+NTRIALS = 40         # trials per run
+
+def blockoffers(offers, blck, ntrials=NTRIALS):
+    '''
+    The offers of run blck (1-4). Raises ValueError for other run numbers.
+    '''
+
+    if blck not in range(1, len(offers)//ntrials + 1):
+        raise ValueError('The run number should be between 1 and %d.' %
+                         (len(offers)//ntrials))
+    return offers[(blck-1)*ntrials:blck*ntrials,:]
+
+def offertext(offer):
+    '''
+    Amount and delay text of an offer (amount, delay in days).
+    '''
+
+    import numpy as np
+
+    amnt = '$'+'%.2f' % (np.round(offer[0], decimals = 1))
+    if offer[1] == 0:
+        delay = 'Today'
+    else:
+        delay = '%.0f' % (offer[1])+' days'
+    return amnt, delay
+
+def offerscreen(offer, colour, tsize=60, amtpos=(0,30), delpos=(0,-30)):
+    '''
+    Preloaded screen with the amount and delay of an offer.
+    '''
+
+    from expyriment import stimuli
+
+    amnt, delay = offertext(offer)
+    screen = stimuli.BlankScreen()
+    stimuli.TextLine(text=amnt, position=amtpos, text_colour=colour,
+                     text_size = tsize).plot(screen)
+    stimuli.TextLine(text=delay, position=delpos, text_colour=colour,
+                     text_size = tsize).plot(screen)
+    screen.preload()
+    return screen
+
+def prepareoffers(offers, tsize=60, amtpos=(0,30), delpos=(0,-30)):
+    '''
+    (first offer screen, second offer screen) of every trial in offers,
+    rows of [famnt fdel pamnt pdel]. Call after control.initialize.
+    '''
+
+    return [(offerscreen(offer[:2], FIRST, tsize, amtpos, delpos),
+             offerscreen(offer[2:], SECOND, tsize, amtpos, delpos))
+            for offer in offers]
+
+def selftest(offers=None, blck=1):
+    '''
+    Prepares a block off screen and prints the time to prepare it and to
+    present a prepared screen versus building and presenting one.
+    '''
+
+    import os, time
+    import numpy as np
+
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    from expyriment import control, design, stimuli
+
+    if offers is None:
+        from Gen_WMITC_offers import genoffers
+        offers = genoffers(.02, 1., seed=0)
+    offers = blockoffers(offers, blck)
+
+    control.set_develop_mode(True)
+    control.defaults.initialize_delay = 0
+    control.defaults.event_logging = 0
+    if hasattr(control.defaults, 'opengl'): # renamed in expyriment 1.0
+        control.defaults.opengl = 0
+    else:
+        control.defaults.open_gl = False
+    exp = design.Experiment('WMITC stimuli')
+    control.initialize(exp)
+
+    start = time.time()
+    screens = prepareoffers(offers)
+    prep = time.time() - start
+
+    cached = []
+    built = []
+    for trial in range(len(offers)):
+        start = time.time()
+        screens[trial][1].present()
+        cached.append(time.time() - start)
+        start = time.time()
+        screen = stimuli.BlankScreen()
+        amnt, delay = offertext(offers[trial,2:])
+        stimuli.TextLine(text=amnt, position=(0,30), text_colour=SECOND,
+                         text_size = 60).plot(screen)
+        stimuli.TextLine(text=delay, position=(0,-30), text_colour=SECOND,
+                         text_size = 60).plot(screen)
+        screen.present()
+        built.append(time.time() - start)
+    control.end(fast_quit=True)
+
+    cached = 1000*np.array(cached)
+    built = 1000*np.array(built)
+    print('prepared %d screens in %.1f ms' % (2*len(screens), 1000*prep))
+    print('present prepared screen: %.2f ms (sd %.2f, max %.2f)' %
+          (cached.mean(), cached.std(), cached.max()))
+    print('build and present:       %.2f ms (sd %.2f, max %.2f)' %
+          (built.mean(), built.std(), built.max()))
+
+if __name__ == '__main__':
+
+    import sys
+    import numpy as np
+
+    offers = None
+    if len(sys.argv) > 1:
+        offers = np.genfromtxt(sys.argv[1], delimiter=',', skip_header=1)
+    selftest(offers)